@@ -1,36 +1,21 @@
 import streamlit as st
 import os
 import nltk
-import json
+import time
 from dotenv import load_dotenv
-from modules.text_gen import TextGenerator
-from modules.audio_gen import AudioGenerator
-from modules.evaluation import Evaluator
+from modules.services import get_text_generator, get_audio_generator, get_evaluator, get_library_store, get_search_index
+from modules.prewarm import get_prewarm_worker
+from modules.scratch import ScratchSpace
+from modules.text_utils import get_shadowing_sentences
+from modules import offline_asr
 
-import re
+from modules.highlight import highlight_html
 
 # Helper for Highlighting
-def highlight_text_html(text, error_words):
-    if not error_words:
-        return text
-    
-    highlighted_text = text
-    # Sort error words by length descending to avoid partial replacement issues
-    # Filter out empty strings or very short noise
-    error_words = sorted(list(set([w for w in error_words if len(w) > 1])), key=len, reverse=True)
-    
-    for word in error_words:
-        # Use regex word boundaries \b to match whole words only, case insensitive
-        try:
-            pattern = re.compile(r'\b' + re.escape(word) + r'\b', re.IGNORECASE)
-            highlighted_text = pattern.sub(
-                lambda m: f'<span style="background-color: #ffcccc; color: #cc0000; padding: 0 2px; border-radius: 3px; font-weight: bold;">{m.group(0)}</span>', 
-                highlighted_text
-            )
-        except:
-            continue
-            
-    return highlighted_text
+def highlight_text_html(text, error_words, error_spans=None):
+    # Positions from the evaluator mark exactly the missed occurrences;
+    # a bare word list (e.g. from Aliyun) marks every occurrence
+    return highlight_html(text, spans=error_spans, words=error_words)
 
 # Load environment variables
 load_dotenv()
@@ -72,28 +57,17 @@ def ensure_nltk_data():
 ensure_nltk_data()
 
 # Library Logic
+# Articles live in SQLite; library.json is imported once on first start.
+LIBRARY_DB = "library.db"
 LIBRARY_FILE = "library.json"
-if not os.path.exists(LIBRARY_FILE):
-    with open(LIBRARY_FILE, "w") as f:
-        json.dump([], f)
-
-def load_library():
-    try:
-        with open(LIBRARY_FILE, "r", encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        return []
+library = get_library_store(db_path=LIBRARY_DB, legacy_json=LIBRARY_FILE)
+LIBRARY_PAGE_SIZE = 20
+# Minimum seconds between redraws while an article is streaming in
+STREAM_RENDER_INTERVAL = 0.1
 
 def save_to_library(item):
-    lib = load_library()
-    # Check duplicate by title
-    for i in lib:
-        if i.get('title') == item.get('title'):
-            lib.remove(i)
-            break
-    lib.append(item)
-    with open(LIBRARY_FILE, "w", encoding='utf-8') as f:
-        json.dump(lib, f, indent=2, ensure_ascii=False)
+    # Replaces any existing article with the same title, atomically
+    library.save(item)
 
 # Set page config (Moved to top)
 # st.set_page_config(page_title="英语个性化跟读工具 Ver 0.1", layout="wide", initial_sidebar_state="expanded")
@@ -265,14 +239,19 @@ with st.sidebar:
         aliyun_app_key = st.text_input("Aliyun AppKey", value=os.getenv("ALIYUN_APP_KEY", ""), type="password")
         aliyun_ak_id = st.text_input("AccessKey ID", value=os.getenv("ALIYUN_AK_ID", ""), type="password")
         aliyun_ak_secret = st.text_input("AccessKey Secret", value=os.getenv("ALIYUN_AK_SECRET", ""), type="password")
+        eval_engine = st.selectbox("评测引擎 (Engine)", ["自动 (Auto)", "离线 (Offline, Vosk)", "声学对比 (Acoustic, DTW)",
+                                    "Google (Online)", "Aliyun"],
+                                   help="离线引擎需要安装 vosk 并设置 VOSK_MODEL_PATH")
         
-    # Initialize modules
-    base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+    # Initialize modules (shared per process and credential set, so
+    # connection pools, tokens and caches survive reruns)
+    base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
     # Pass api_key explicitly (loaded from env)
-    text_gen = TextGenerator(api_key=api_key, base_url=base_url)
-    audio_gen = AudioGenerator(api_key=api_key)
-    # Pass Aliyun credentials explicitly
-    evaluator = Evaluator(app_key=aliyun_app_key, ak_id=aliyun_ak_id, ak_secret=aliyun_ak_secret)
+    text_gen = get_text_generator(api_key=api_key, base_url=base_url)
+    audio_gen = get_audio_generator(api_key=api_key)
+    # Pass Aliyun credentials explicitly; acoustic references reuse audio_gen
+    evaluator = get_evaluator(app_key=aliyun_app_key, ak_id=aliyun_ak_id, ak_secret=aliyun_ak_secret,
+                              audio_gen=audio_gen)
 
     # Mode specific settings
     if mode == "✨ AI 生成 (Generate)":
@@ -302,6 +281,24 @@ if 'evaluation_result' not in st.session_state:
     st.session_state.evaluation_result = None
 if 'active_tab' not in st.session_state:
     st.session_state.active_tab = "📖 阅读 (Read)" # Default tab
+if 'scratch' not in st.session_state:
+    # Per-session files so concurrent users never overwrite each other's audio
+    st.session_state.scratch = ScratchSpace()
+scratch = st.session_state.scratch
+
+def pick_eval_method():
+    # Auto: Aliyun when configured, else on-box recognition when a model is installed
+    if eval_engine == "Aliyun":
+        return "aliyun"
+    if eval_engine.startswith("离线"):
+        return "offline"
+    if eval_engine.startswith("声学"):
+        return "acoustic"
+    if eval_engine.startswith("Google"):
+        return "local"
+    if aliyun_app_key and aliyun_ak_id:
+        return "aliyun"
+    return "offline" if offline_asr.is_available() else "local"
 
 # Helper to process imported text
 def process_imported_text(text, title="Custom Content"):
@@ -325,19 +322,44 @@ def process_imported_text(text, title="Custom Content"):
 # Main Content
 if mode == "✨ AI 生成 (Generate)":
     st.header("1. 定制文本生成 (Text Generation)")
+    # Same grade + topic is served from the generation cache unless a new variant is requested
+    fresh_variant = st.checkbox("🔄 换一篇 (New variant)", value=False)
     if st.button("✨ 生成跟读文本 (Generate Text)", use_container_width=True):
         if not api_key:
             st.error("⚠️ 未找到 API Key。请确保 .env 文件中已配置 DASHSCOPE_API_KEY。")
         else:
-            with st.spinner("正在生成..."):
-                try:
-                    data = text_gen.generate_text(full_grade_info, interest)
-                    st.session_state.generated_text = data
-                    st.session_state.audio_path = None
-                    st.session_state.evaluation_result = None
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"生成失败: {e}")
+            # Stream the article so the title and text appear while the rest is generated
+            status_ph = st.empty()
+            title_ph = st.empty()
+            content_ph = st.empty()
+            status_ph.info("正在生成...")
+            try:
+                data = None
+                last_render = 0.0
+                for partial, done in text_gen.generate_text_stream(full_grade_info, interest, fresh=fresh_variant,
+                                                                  pipeline=True):
+                    if done:
+                        data = partial
+                        break
+                    now = time.time()
+                    if now - last_render < STREAM_RENDER_INTERVAL:
+                        continue
+                    last_render = now
+                    if partial.get('title'):
+                        title_ph.markdown(f"## {partial['title']}")
+                    if partial.get('content'):
+                        content_ph.markdown(partial['content'])
+                    if 'keywords' in partial or 'analysis' in partial:
+                        status_ph.info("正文已生成，正在生成解析... (Generating analysis)")
+                # Remember the level so the library can be filtered by grade
+                data['grade'] = full_grade_info
+                st.session_state.generated_text = data
+                st.session_state.audio_path = None
+                st.session_state.evaluation_result = None
+                st.rerun()
+            except Exception as e:
+                status_ph.empty()
+                st.error(f"生成失败: {e}")
 
 elif mode == "📥 自定义导入 (Import)":
     st.header("1. 自定义导入 (Custom Import)")
@@ -355,9 +377,18 @@ elif mode == "📥 自定义导入 (Import)":
             imported_content = uploaded_file.read().decode("utf-8")
             imported_title = uploaded_file.name
     
+    # Imported texts get the same vocabulary/grammar/test analysis as generated ones
+    with_analysis = st.checkbox("🧠 生成解析 (Generate analysis)", value=bool(api_key), disabled=not api_key)
+
     if st.button("🚀 处理文本 (Process Text)", use_container_width=True):
         if imported_content.strip():
             data = process_imported_text(imported_content, imported_title)
+            if with_analysis:
+                with st.spinner("正在生成解析..."):
+                    try:
+                        data['analysis'] = text_gen.analyze_text(data['content'])
+                    except Exception as e:
+                        st.warning(f"解析生成失败: {e}")
             st.session_state.generated_text = data
             st.session_state.audio_path = None
             st.session_state.evaluation_result = None
@@ -368,32 +399,65 @@ elif mode == "📥 自定义导入 (Import)":
 
 elif mode == "📚 我的书库 (Library)":
     st.header("📚 我的书库 (Library)")
-    lib = load_library()
-    if not lib:
+    if not library.count():
         st.info("书库为空，请先生成或导入文本。")
     else:
-        # Filter by tag
-        all_tags = set()
-        for item in lib:
-            all_tags.update(item.get('tags', []))
-        
-        selected_tag = st.selectbox("按标签筛选 (Filter by Tag)", ["All"] + list(all_tags))
-        
-        filtered_lib = lib
-        if selected_tag != "All":
-            filtered_lib = [i for i in lib if selected_tag in i.get('tags', [])]
-            
-        # Display list
-        for idx, item in enumerate(filtered_lib):
-            with st.expander(f"{item['title']} (Tags: {', '.join(item.get('tags', []))})"):
-                st.write(item['content'][:200] + "...")
-                col_load, col_del = st.columns([1, 5])
-                with col_load:
-                    if st.button("Load", key=f"load_{idx}"):
-                        st.session_state.generated_text = item
-                        st.session_state.audio_path = None
-                        st.session_state.evaluation_result = None
-                        st.rerun()
+        # Inverted index over title/content/keywords/vocabulary, updated on every save.
+        # It is built on a background thread the first time; until then tags and
+        # paging come straight from SQLite and text/stage search waits for it.
+        library_index = get_search_index(db_path=LIBRARY_DB, legacy_json=LIBRARY_FILE, background=True)
+        index_ready = library_index.ready.is_set()
+
+        # Search & filters (served from the inverted index)
+        search_query = st.text_input("🔍 搜索 (Search)", placeholder="e.g. space atmosphere")
+        col_tag, col_grade = st.columns(2)
+        with col_tag:
+            all_tags = library_index.tags() if index_ready else library.tags()
+            selected_tag = st.selectbox("按标签筛选 (Filter by Tag)", ["All"] + list(all_tags))
+        with col_grade:
+            selected_grade = st.selectbox("按学段筛选 (Filter by Stage)", ["All", "Primary", "Junior", "Senior", "Adult"])
+
+        tag_filter = None if selected_tag == "All" else selected_tag
+        grade_filter = None if selected_grade == "All" else selected_grade
+        searching = bool(search_query.strip() or grade_filter)
+        if searching and not index_ready:
+            st.info("搜索索引正在建立，请稍后再试 (Search index is still building; showing all articles).")
+            searching = False
+        if searching:
+            # Ranked ids are cheap; only the visible page is read from the store
+            hit_ids = [doc_id for doc_id, _ in library_index.search(search_query, tag=tag_filter,
+                                                                    grade=grade_filter, limit=None)]
+            total = len(hit_ids)
+        else:
+            total = library.count(tag=tag_filter)
+
+        if not total:
+            st.info("没有找到匹配的文章 (No matching articles).")
+        else:
+            page_count = (total + LIBRARY_PAGE_SIZE - 1) // LIBRARY_PAGE_SIZE
+            col_page, col_total = st.columns([1, 3])
+            with col_page:
+                page = st.number_input("页码 (Page)", min_value=1, max_value=page_count, value=1, step=1)
+            with col_total:
+                st.caption(f"共 {total} 篇 · 第 {page}/{page_count} 页")
+            offset = (page - 1) * LIBRARY_PAGE_SIZE
+            if searching:
+                page_items = library.summaries_for(hit_ids[offset:offset + LIBRARY_PAGE_SIZE])
+            else:
+                page_items = library.summaries(tag=tag_filter, offset=offset, limit=LIBRARY_PAGE_SIZE)
+
+            # Display the current page; full article bodies are only fetched on Load
+            for summary in page_items:
+                with st.expander(f"{summary['title']} (Tags: {', '.join(summary['tags'])})"):
+                    st.write(summary['snippet'] + "...")
+                    st.caption(f"{summary['word_count']} words")
+                    col_load, col_del = st.columns([1, 5])
+                    with col_load:
+                        if st.button("Load", key=f"load_{summary['id']}"):
+                            st.session_state.generated_text = library.get(summary['id'])
+                            st.session_state.audio_path = None
+                            st.session_state.evaluation_result = None
+                            st.rerun()
 
 # Display Content & Audio (Common for all modes if data loaded)
 if st.session_state.generated_text:
@@ -412,6 +476,8 @@ if st.session_state.generated_text:
              if st.button("💾 保存 (Save)", use_container_width=True):
                  data['tags'] = new_tags
                  save_to_library(data)
+                 # Pre-render full-text and sentence audio so replays are instant
+                 get_prewarm_worker(audio_gen).enqueue(data, sources=["qwen" if api_key else "edge"])
                  st.success("已保存！")
 
     # Tabs for organization
@@ -501,12 +567,29 @@ if st.session_state.generated_text:
         # 1. Full Article Audio
         st.subheader("🔊 全文跟读 (Full Text)")
         if st.button("▶️ 生成/播放全文音频", use_container_width=True):
+            first_audio = st.empty()
+            streamed = []
+
+            # Start playback as soon as the first sentence is synthesized,
+            # while the rest of the article is still being generated.
+            def play_first_segment(idx, sentence, segment):
+                streamed.append(idx)
+                if idx == 0:
+                    first_audio.audio(segment, format="audio/mpeg", autoplay=True)
+
             with st.spinner("正在合成音频..."):
                 src_code = "qwen" if "Qwen" in tts_source else "edge"
-                audio_path = audio_gen.generate_audio(data['content'], rate=speed, source=src_code)
+                audio_path = audio_gen.generate_audio(data['content'], rate=speed, source=src_code, on_segment=play_first_segment, scratch=scratch)
                 st.session_state.audio_path = audio_path
+            # A rerun would cut off the first sentence that is already playing,
+            # so only rerun when the audio came straight from the cache.
+            if not streamed:
                 st.rerun()
                 
+        if st.session_state.audio_path and not os.path.exists(st.session_state.audio_path):
+            # Swept after the session sat idle past its TTL
+            st.session_state.audio_path = None
+
         if st.session_state.audio_path:
             st.audio(st.session_state.audio_path)
             with open(st.session_state.audio_path, "rb") as f:
@@ -517,15 +600,7 @@ if st.session_state.generated_text:
         st.subheader("🎤 逐句精练 (Sentence Shadowing)")
         
         # Get sentences from analysis or fallback to simple split
-        shadow_sentences = []
-        if data.get('analysis') and isinstance(data['analysis'], dict) and data['analysis'].get('shadowing_sentences'):
-             shadow_sentences = data['analysis']['shadowing_sentences']
-        else:
-             # Fallback: Split content into sentences and take first 5
-             try:
-                 shadow_sentences = nltk.sent_tokenize(data['content'])[:5]
-             except:
-                 shadow_sentences = data['content'].split('.')[:5]
+        shadow_sentences = get_shadowing_sentences(data)
         
         if not shadow_sentences:
             st.info("No sentences available for shadowing.")
@@ -546,7 +621,7 @@ if st.session_state.generated_text:
                 if st.button("🎧 播放标准音 (Play Standard)", key=f"play_sent_{selected_sent_idx}"):
                      src_code = "qwen" if "Qwen" in tts_source else "edge"
                      # Generate temporary audio for this sentence
-                     sent_audio = audio_gen.generate_audio(current_sent, filename=f"sent_{selected_sent_idx}.mp3", rate=speed, source=src_code)
+                     sent_audio = audio_gen.generate_audio(current_sent, filename=f"sent_{selected_sent_idx}.mp3", rate=speed, source=src_code, scratch=scratch)
                      st.audio(sent_audio, autoplay=True)
             
             with c_rec:
@@ -556,30 +631,20 @@ if st.session_state.generated_text:
             if sent_audio_input:
                 if st.button("📝 立即评测 (Evaluate Now)", key=f"eval_sent_{selected_sent_idx}", type="primary"):
                     with st.spinner("Analyzing pronunciation..."):
-                         # Save user audio
-                         user_sent_path = f"user_sent_{selected_sent_idx}.wav"
-                         with open(user_sent_path, "wb") as f:
-                             f.write(sent_audio_input.read())
-                         
-                         # Convert to WAV 16k mono (standard requirement)
-                         try:
-                             from pydub import AudioSegment
-                             sound = AudioSegment.from_file(user_sent_path)
-                             sound = sound.set_frame_rate(16000).set_channels(1)
-                             sound.export(user_sent_path, format="wav")
-                         except Exception as e:
-                             st.error(f"Audio conversion error: {e}")
+                         # Recording bytes go straight to the evaluator, which
+                         # resamples to 16k mono WAV in memory (no temp files)
+                         user_sent_audio = sent_audio_input.getvalue()
 
                          # Evaluate
-                         eval_method = "aliyun" if (aliyun_app_key and aliyun_ak_id) else "local"
-                         sent_res = evaluator.evaluate_audio(user_sent_path, current_sent, method=eval_method)
+                         eval_method = pick_eval_method()
+                         sent_res = evaluator.evaluate_audio(user_sent_audio, current_sent, method=eval_method)
                          
                          # Display Result
                          st.success(f"Score: {sent_res.get('total_score', 0)}")
                          st.info(sent_res.get('feedback', ''))
                          
                          # Highlighted Result
-                         hl_html = highlight_text_html(current_sent, sent_res.get('error_words', []))
+                         hl_html = highlight_text_html(current_sent, sent_res.get('error_words', []), sent_res.get('error_spans'))
                          st.markdown(f"""
                          <div style="margin-top: 10px; padding: 15px; background: white; border: 1px solid #eee; border-radius: 8px;">
                             <strong>Feedback:</strong><br>
@@ -596,22 +661,12 @@ if st.session_state.generated_text:
         if audio_input:
             if st.button("📝 开始评测 (Evaluate)", use_container_width=True):
                 with st.spinner("正在评测..."):
-                    with open("user_recording.wav", "wb") as f:
-                        f.write(audio_input.read())
-                    
-                    # Convert to WAV using pydub to ensure compatibility
-                    try:
-                        from pydub import AudioSegment
-                        sound = AudioSegment.from_file("user_recording.wav")
-                        sound = sound.set_frame_rate(16000).set_channels(1)
-                        sound.export("user_recording.wav", format="wav")
-                    except Exception as e:
-                        print(f"Audio conversion warning: {e}")
+                    user_recording = audio_input.getvalue()
 
                     # Determine method based on keys or user preference
-                    eval_method = "aliyun" if (aliyun_app_key and aliyun_ak_id) else "local"
+                    eval_method = pick_eval_method()
                     
-                    res = evaluator.evaluate_audio("user_recording.wav", data['content'], method=eval_method)
+                    res = evaluator.evaluate_audio(user_recording, data['content'], method=eval_method)
                     st.session_state.evaluation_result = res
                     st.rerun()
 
@@ -631,7 +686,7 @@ if st.session_state.generated_text:
             st.markdown("### 🔍 详细反馈 (Detailed Feedback)")
             st.caption("🔴 红色高亮单词表示发音需改进 (Red highlights indicate pronunciation issues).")
             
-            hl_html = highlight_text_html(data['content'], res.get('error_words', []))
+            hl_html = highlight_text_html(data['content'], res.get('error_words', []), res.get('error_spans'))
             st.markdown(f"""
             <div class="content-card" style="font-size: 16px; line-height: 2.0;">
                 {hl_html.replace(chr(10), '<br>')}
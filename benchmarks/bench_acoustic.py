@@ -0,0 +1,82 @@
+"""
+Acoustic (DTW) scoring speed on synthetic speech-like audio: feature
+extraction + alignment time versus recording length (real-time factor),
+with the reference prepared once and cached as in the app.
+
+The "learner" reads 15% slower than the reference, with noise, and one
+word replaced by a different sound, which should come out as the error word.
+
+Usage: python -m benchmarks.bench_acoustic [--seconds 5 15 30]
+"""
+import argparse
+import time
+import zlib
+
+import numpy as np
+
+from modules.acoustic import AcousticScorer, SAMPLE_RATE
+
+WORD_SECONDS = 0.35
+GAP_SECONDS = 0.08
+
+
+def word_sound(word, seconds, rng):
+    # A voiced "syllable": pitch harmonics shaped by two word-specific formants
+    seed = zlib.crc32(word.encode("utf-8"))
+    f0 = 110 + seed % 60
+    formants = (300 + seed % 500, 900 + (seed >> 8) % 1400)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    sound = np.zeros_like(t)
+    for h in range(1, 30):
+        freq = f0 * h
+        gain = sum(np.exp(-((freq - f) / 120.0) ** 2) for f in formants)
+        sound += gain * np.sin(2 * np.pi * freq * t + rng.random())
+    envelope = np.sin(np.pi * t / seconds) ** 0.5
+    return (sound * envelope).astype(np.float32)
+
+
+def read(words, stretch=1.0, noise=0.0, swap=None, seed=0):
+    rng = np.random.default_rng(seed)
+    parts, boundaries, cursor = [], [], 0.0
+    gap = np.zeros(int(GAP_SECONDS * stretch * SAMPLE_RATE), dtype=np.float32)
+    for i, word in enumerate(words):
+        sound = word_sound(swap if i == len(words) // 2 and swap else word, WORD_SECONDS * stretch, rng)
+        boundaries.append((word, cursor, cursor + len(sound) / SAMPLE_RATE))
+        cursor += (len(sound) + len(gap)) / SAMPLE_RATE
+        parts += [sound, gap]
+    audio = np.concatenate(parts)
+    audio = audio / np.abs(audio).max() * 0.5
+    if noise:
+        audio = audio + rng.normal(0, noise, len(audio)).astype(np.float32)
+    return audio, boundaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, nargs="+", default=[5, 15, 30])
+    args = parser.parse_args()
+
+    scorer = AcousticScorer(audio_gen=False)
+    vocab = "the sky is blue because light scatters in our atmosphere every single day".split()
+    print(f"{'recording':>10}{'words':>7}{'reference':>12}{'score':>11}{'RTF':>8}{'total':>7}{'errors':>22}")
+    for seconds in args.seconds:
+        n_words = max(3, int(seconds / ((WORD_SECONDS + GAP_SECONDS) * 1.15)))
+        words = [vocab[i % len(vocab)] for i in range(n_words)]
+        text = " ".join(words)
+        ref_audio, boundaries = read(words, seed=1)
+        user_audio, _ = read(words, stretch=1.15, noise=0.01, swap="zebra", seed=2)
+        duration = len(user_audio) / SAMPLE_RATE
+
+        start = time.perf_counter()
+        reference = scorer.prepare_reference(ref_audio, text, boundaries, sample_rate=SAMPLE_RATE)
+        prep = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = scorer.score(user_audio, text, sample_rate=SAMPLE_RATE, reference=reference)
+        elapsed = time.perf_counter() - start
+        print(f"{duration:>8.1f} s{n_words:>7}{prep * 1e3:>9.0f} ms{elapsed * 1e3:>8.0f} ms{elapsed / duration:>8.3f}"
+              f"{result['total_score']:>7}  {', '.join(result['error_words'])[:20]:>20}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Transcript-vs-reference word alignment on Senior-length articles:
+difflib.SequenceMatcher (the old _compare_texts) versus modules.alignment.
+
+Each case reads a synthetic article whose words follow a Zipf distribution
+over a 2000-word vocabulary (so function words repeat heavily, as in real
+text) with a given share of words dropped or replaced. --vocab 30 gives a
+worst case with almost no distinctive words to anchor on. "missed" counts
+reference words reported as errors; "planted" is how many errors were
+actually introduced. "align" starts with empty token caches; "warm" is
+another student reading the same article (tokenized reference cached).
+
+Usage: python -m benchmarks.bench_alignment [--words 1000 3000] [--error-rates 0.02 0.1 0.5] [--vocab 2000]
+"""
+import argparse
+import difflib
+import random
+import string
+import time
+
+from modules.alignment import align, normalize_token, reference_tokens
+
+FUNCTION_WORDS = "the a of to and in is it that was for on with as by at this from or".split()
+
+
+def pseudo_word(i):
+    # Letters only, so the tokenizer does not read them as numbers
+    letters = ""
+    while True:
+        i, r = divmod(i, 26)
+        letters += "bcdfghjklmnpqrstvwxyzaeiou"[r]
+        if not i:
+            return "w" + letters
+
+
+def make_reading(n_words, error_rate, vocab=2000, seed=0):
+    rng = random.Random(seed)
+    words = FUNCTION_WORDS + [pseudo_word(i) for i in range(max(0, vocab - len(FUNCTION_WORDS)))]
+    weights = [1.0 / (rank + 1) for rank in range(len(words))]
+    ref = rng.choices(words, weights, k=n_words)
+    heard = []
+    planted = 0
+    for word in ref:
+        roll = rng.random()
+        if roll < error_rate / 2:
+            planted += 1                      # skipped
+        elif roll < error_rate:
+            planted += 1
+            heard.append("q" + word)         # misread
+        else:
+            heard.append(word)
+    return " ".join(ref), " ".join(heard), planted
+
+
+def difflib_errors(user_text, ref_text):
+    def normalize(t):
+        return t.translate(str.maketrans('', '', string.punctuation)).lower().split()
+    r_words, u_words = normalize(ref_text), normalize(user_text)
+    matcher = difflib.SequenceMatcher(None, r_words, u_words)
+    errors = [w for tag, i1, i2, _, _ in matcher.get_opcodes() if tag in ('replace', 'delete')
+              for w in r_words[i1:i2]]
+    return matcher.ratio(), errors
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, nargs="+", default=[1000, 3000])
+    parser.add_argument("--error-rates", type=float, nargs="+", default=[0.02, 0.1, 0.5])
+    parser.add_argument("--vocab", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'words':>6}{'errors':>8}{'planted':>9}{'difflib':>11}{'missed':>8}{'ratio':>7}"
+          f"{'align':>11}{'warm':>11}{'missed':>8}{'ratio':>7}")
+    for n_words in args.words:
+        for rate in args.error_rates:
+            ref, heard, planted = make_reading(n_words, rate, args.vocab)
+            old_t, (old_ratio, old_errors) = timed(lambda: difflib_errors(heard, ref), args.repeat)
+
+            def cold():
+                normalize_token.cache_clear()
+                reference_tokens.cache_clear()
+                return align(ref, heard)
+            new_t, result = timed(cold, args.repeat)
+            warm_t, _ = timed(lambda: align(ref, heard), args.repeat)
+            new_errors = [w for w in result["words"] if w["status"] != "match"]
+            print(f"{n_words:>6}{rate:>8.0%}{planted:>9}{old_t * 1e3:>8.1f} ms{len(old_errors):>8}{old_ratio:>7.2f}"
+                  f"{new_t * 1e3:>8.1f} ms{warm_t * 1e3:>8.1f} ms{len(new_errors):>8}{result['ratio']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
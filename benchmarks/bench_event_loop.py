@@ -0,0 +1,57 @@
+"""
+Per-call overhead of asyncio.run() versus the shared BackgroundLoop.
+
+Synthesis itself is replaced by a short no-op coroutine so the numbers only
+reflect event-loop setup/teardown and cross-thread submission cost.
+
+Usage: python -m benchmarks.bench_event_loop [--calls 2000] [--threads 8]
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.event_loop import BackgroundLoop
+
+
+async def fake_synthesis():
+    await asyncio.sleep(0)
+    return b"\xff\xf3"
+
+
+def per_call_asyncio_run():
+    return asyncio.run(fake_synthesis())
+
+
+def bench(label, fn, calls, threads):
+    start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda _: fn(), range(calls)))
+    else:
+        for _ in range(calls):
+            fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed * 1e6 / calls:9.1f} us/call  ({calls} calls, {threads} thread(s))")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    loop = BackgroundLoop(name="bench-loop")
+    loop.run(fake_synthesis())  # start the thread outside the timed region
+
+    for threads in (1, args.threads):
+        before = bench("asyncio.run per call", per_call_asyncio_run, args.calls, threads)
+        after = bench("BackgroundLoop.run", lambda: loop.run(fake_synthesis()), args.calls, threads)
+        print(f"{'speedup':<34} {before / after:9.1f}x\n")
+
+    loop.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Full-text feedback highlighting: the old per-word regex substitution
+(copied from app.py) versus modules.highlight, by article length and
+number of distinct error words. "repeat" is a second render of the same
+result (Streamlit reruns), served from the cached token index.
+
+Usage: python -m benchmarks.bench_highlight [--words 1000 3000] [--errors 5 50 200]
+"""
+import argparse
+import random
+import re
+import time
+
+from benchmarks.bench_alignment import make_reading
+from modules.highlight import highlight_html, token_index, word_spans
+
+
+def old_highlight(text, error_words):
+    highlighted_text = text
+    error_words = sorted(list(set([w for w in error_words if len(w) > 1])), key=len, reverse=True)
+    for word in error_words:
+        pattern = re.compile(r'\b' + re.escape(word) + r'\b', re.IGNORECASE)
+        highlighted_text = pattern.sub(
+            lambda m: f'<span style="background-color: #ffcccc; color: #cc0000; padding: 0 2px; border-radius: 3px; font-weight: bold;">{m.group(0)}</span>',
+            highlighted_text
+        )
+    return highlighted_text
+
+
+def timed(fn, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, nargs="+", default=[1000, 3000])
+    parser.add_argument("--errors", type=int, nargs="+", default=[5, 50, 200])
+    args = parser.parse_args()
+
+    print(f"{'words':>6}{'errors':>8}{'regex':>11}{'words':>11}{'spans':>11}{'repeat':>11}")
+    for n_words in args.words:
+        text, _, _ = make_reading(n_words, 0)
+        vocab = sorted(set(text.split()))
+        for n_errors in args.errors:
+            rng = random.Random(n_errors)
+            errors = rng.sample(vocab, min(n_errors, len(vocab)))
+            spans = sorted(rng.sample(sorted(s for w in errors for s in token_index(text)[w]), n_errors))
+
+            old = timed(lambda: old_highlight(text, errors))
+
+            def cold():
+                token_index.cache_clear()
+                word_spans.cache_clear()
+                highlight_html(text, words=errors)
+            by_words = timed(cold)
+            by_spans = timed(lambda: (token_index.cache_clear(), highlight_html(text, spans=spans)))
+            repeat = timed(lambda: highlight_html(text, words=errors))
+            print(f"{n_words:>6}{n_errors:>8}{old:>8.2f} ms{by_words:>8.2f} ms{by_spans:>8.2f} ms{repeat:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Library load/save/filter/page render: whole-file library.json (the old app.py logic)
+versus the SQLite LibraryStore.
+
+Usage: python -m benchmarks.bench_library [--sizes 10000 100000] [--saves 20]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from modules.library_store import LibraryStore
+
+TAGS = ["Automotive", "Numerology", "Workplace", "General", "Exam", "Fun"]
+WORDS = "the sky is blue because light scatters in the atmosphere over time".split()
+
+
+def make_article(i, words):
+    rng = random.Random(i)
+    return {
+        "title": f"Article {i}",
+        "content": " ".join(rng.choice(WORDS) for _ in range(words)),
+        "keywords": rng.sample(WORDS, 3),
+        "chinese_translation": [],
+        "tags": rng.sample(TAGS, 2),
+    }
+
+
+# --- Old behaviour (copied from app.py before the store existed) ---
+
+def json_load(path):
+    with open(path, "r", encoding='utf-8') as f:
+        return json.load(f)
+
+
+def json_save(path, item):
+    lib = json_load(path)
+    for i in lib:
+        if i.get('title') == item.get('title'):
+            lib.remove(i)
+            break
+    lib.append(item)
+    with open(path, "w", encoding='utf-8') as f:
+        json.dump(lib, f, indent=2, ensure_ascii=False)
+
+
+def json_filter(path, tag):
+    lib = json_load(path)
+    all_tags = set()
+    for item in lib:
+        all_tags.update(item.get('tags', []))
+    return [i for i in lib if tag in i.get('tags', [])]
+
+
+def json_render_list(path):
+    # The old Library view built an expander snippet for every article
+    return [(i['title'], i['content'][:200]) for i in json_load(path)]
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(size, saves, words, workdir):
+    articles = [make_article(i, words) for i in range(size)]
+    json_path = os.path.join(workdir, f"library_{size}.json")
+    with open(json_path, "w", encoding='utf-8') as f:
+        json.dump(articles, f, indent=2, ensure_ascii=False)
+
+    db_path = os.path.join(workdir, f"library_{size}.db")
+    start = time.perf_counter()
+    store = LibraryStore(db_path=db_path, legacy_json=json_path)
+    migrate = time.perf_counter() - start
+
+    new_items = [make_article(size + i, words) for i in range(saves)]
+    rows = [
+        ("load (count + tags)", timed(lambda: json_load(json_path)),
+         timed(lambda: (store.count(), store.tags()), 20)),
+        (f"save x{saves}", timed(lambda: [json_save(json_path, it) for it in new_items]) / saves,
+         timed(lambda: [store.save(it) for it in new_items]) / saves),
+        ("filter by tag", timed(lambda: json_filter(json_path, "Exam")),
+         timed(lambda: store.list(tag="Exam"), 3)),
+        ("render library page", timed(lambda: json_render_list(json_path)),
+         timed(lambda: store.summaries(offset=size // 2, limit=20), 20)),
+        ("get by title", timed(lambda: next(i for i in json_load(json_path) if i['title'] == f"Article {size // 2}")),
+         timed(lambda: store.get_by_title(f"Article {size // 2}"), 100)),
+    ]
+    print(f"\n{size} articles (one-time migration from JSON: {migrate:.2f} s)")
+    print(f"{'operation':<22}{'library.json':>14}{'LibraryStore':>14}{'speedup':>10}")
+    for name, old, new in rows:
+        print(f"{name:<22}{old * 1e3:>11.2f} ms{new * 1e3:>11.3f} ms{old / new:>9.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--saves", type=int, default=20)
+    parser.add_argument("--words", type=int, default=150, help="Words per synthetic article")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix="bench_library_") as workdir:
+        for size in args.sizes:
+            run(size, args.saves, args.words, workdir)
+
+
+if __name__ == "__main__":
+    main()
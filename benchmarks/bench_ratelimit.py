@@ -0,0 +1,55 @@
+"""
+Burst of Aliyun assessments against the local stub (quota: --quota req/s):
+unthrottled calls versus the shared "aliyun_nls" provider. Counts how many
+evaluations got a real score instead of falling back to _evaluate_mock.
+
+Usage: python -m benchmarks.bench_ratelimit [--requests 60] [--workers 20] [--quota 5]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import stub_server
+from modules import evaluation, ratelimit
+from modules.evaluation import Evaluator
+
+WAV = b"RIFF" + b"\x00" * 40
+
+
+def run(label, requests, workers, quota, provider_settings):
+    server, state = stub_server.start(rps=quota, burst=int(quota), latency=0.1)
+    os.environ["ALIYUN_NLS_GATEWAY"] = f"http://127.0.0.1:{server.server_address[1]}"
+    ratelimit.reset()
+    ratelimit._providers["aliyun_nls"] = ratelimit.Provider("aliyun_nls", **provider_settings)
+
+    evaluator = Evaluator(app_key="stub", ak_id="stub", ak_secret="stub")
+    # Pre-seed the token cache so no real CreateToken call is made
+    evaluation._token_cache[evaluator._token_cache_key()] = ("stub-token", time.time() + 3600)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda _: evaluator._evaluate_aliyun(WAV, "hello world"), range(requests)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    real = sum(1 for r in results if r.get("fluency_score") == 77 and r.get("integrity_score") == 99)
+    print(f"{label:<14}{real:>6}/{requests:<6}{requests - real:>10}{state.counts['throttled']:>11}{elapsed:>10.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=20)
+    parser.add_argument("--quota", type=float, default=5.0, help="Stub server requests per second")
+    args = parser.parse_args()
+
+    print(f"{'client':<14}{'scored':>13}{'fallbacks':>10}{'429s seen':>11}{'wall':>12}")
+    run("unthrottled", args.requests, args.workers, args.quota,
+        {"rate": 1e6, "burst": 1e6, "max_concurrency": args.workers, "max_retries": 0})
+    run("provider", args.requests, args.workers, args.quota,
+        {"rate": args.quota, "burst": args.quota, "max_concurrency": 8})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Rerun latency of app.py's engine setup under a burst of widget interactions.
+
+Each simulated rerun does what the sidebar block does: obtain a
+TextGenerator, AudioGenerator and Evaluator. "per-rerun" constructs them
+from scratch (the old behaviour); "shared" goes through modules.services.
+
+Usage: python -m benchmarks.bench_rerun [--reruns 500] [--threads 16]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import services
+from modules.text_gen import TextGenerator
+from modules.audio_gen import AudioGenerator
+from modules.evaluation import Evaluator
+
+BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+
+def rerun_constructing(api_key, output_dir):
+    TextGenerator(api_key=api_key, base_url=BASE_URL)
+    AudioGenerator(output_dir=output_dir, api_key=api_key)
+    Evaluator(app_key="app", ak_id="id", ak_secret="secret")
+
+
+def rerun_shared(api_key, output_dir):
+    services.get_text_generator(api_key=api_key, base_url=BASE_URL)
+    services.get_audio_generator(api_key=api_key, output_dir=output_dir)
+    services.get_evaluator(app_key="app", ak_id="id", ak_secret="secret")
+
+
+def bench(label, fn, reruns, threads):
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(reruns)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<12} mean {statistics.mean(latencies) * 1e3:8.3f} ms   "
+          f"p95 {p95 * 1e3:8.3f} ms   burst wall {wall * 1e3:8.1f} ms")
+    return statistics.mean(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--cache-entries", type=int, default=200,
+                        help="Files pre-seeded in the audio cache (scanned on every AudioGenerator construction)")
+    args = parser.parse_args()
+
+    api_key = "sk-benchmark"
+    output_dir = tempfile.mkdtemp(prefix="bench_rerun_")
+    cache_dir = os.path.join(output_dir, "cache")
+    os.makedirs(cache_dir)
+    for i in range(args.cache_entries):
+        with open(os.path.join(cache_dir, f"{i:064x}.mp3"), "wb") as f:
+            f.write(b"\xff\xf3" * 512)
+
+    print(f"{args.reruns} reruns across {args.threads} threads")
+    before = bench("per-rerun", lambda: rerun_constructing(api_key, output_dir), args.reruns, args.threads)
+    after = bench("shared", lambda: rerun_shared(api_key, output_dir), args.reruns, args.threads)
+    print(f"{'speedup':<12} {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Query latency of the library SearchIndex on a synthetic Zipf-distributed corpus.
+
+Usage: python -m benchmarks.bench_search [--docs 100000]
+"""
+import argparse
+import itertools
+import random
+import time
+
+from modules.library_search import SearchIndex
+
+QUERIES = [
+    ("rare term", "w5000"),
+    ("two mid-frequency terms", "w500 w800"),
+    ("mid term + tag", "w2000"),
+    ("two very common terms", "w50 w60"),
+]
+
+
+def build(n_docs, vocab, words):
+    rng = random.Random(0)
+    terms = [f"w{i}" for i in range(vocab)]
+    cum = list(itertools.accumulate(1 / (i + 1) for i in range(vocab)))
+    index = SearchIndex()
+    start = time.perf_counter()
+    for doc_id in range(n_docs):
+        body = rng.choices(terms, cum_weights=cum, k=words)
+        index.add(doc_id, {
+            "title": " ".join(body[:5]),
+            "content": " ".join(body),
+            "tags": ["Exam" if doc_id % 3 else "Fun"],
+            "grade": "初中 (Junior) - 初三 (Grade 9)",
+        })
+    return index, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    index, build_time = build(args.docs, args.vocab, args.words)
+    print(f"Indexed {args.docs} docs in {build_time:.1f} s")
+    for label, query in QUERIES:
+        tag = "Fun" if "tag" in label else None
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            hits = index.search(query, tag=tag, limit=20)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{label:<26} {query!r:<14} {elapsed * 1e3:8.3f} ms  ({len(hits)} hits)")
+
+
+if __name__ == "__main__":
+    main()
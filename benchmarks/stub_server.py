@@ -0,0 +1,120 @@
+"""
+Local stand-in for the DashScope chat API and the Aliyun SpeechAssessment
+gateway, with a server-side quota, for exercising modules.ratelimit.
+
+Requests beyond --rps (token bucket, burst --burst) get 429 with Retry-After;
+--error-rate of the remaining ones fail with 503. Point the app at it with
+DASHSCOPE_BASE_URL=http://127.0.0.1:8099/v1 and ALIYUN_NLS_GATEWAY=http://127.0.0.1:8099.
+
+Usage: python -m benchmarks.stub_server [--port 8099] [--rps 5] [--latency 0.2]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ARTICLE = {
+    "title": "A Trip to Space",
+    "content": "Astronauts train for years. They float in the station and look down at Earth.",
+    "keywords": ["astronaut", "station", "float"],
+    "chinese_translation": ["宇航员", "空间站", "漂浮"],
+}
+ASSESSMENT = {"result": {"pronunciation_score": 88, "fluency_score": 77, "integrity_score": 99, "words": []}}
+
+
+class StubState:
+    def __init__(self, rps, burst, latency, error_rate):
+        self.rps = rps
+        self.burst = burst
+        self.latency = latency
+        self.error_rate = error_rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.counts = {"ok": 0, "throttled": 0, "errors": 0}
+
+    def admit(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rps)
+            self.updated = now
+            if self.tokens < 1:
+                self.counts["throttled"] += 1
+                return 429
+            self.tokens -= 1
+            if random.random() < self.error_rate:
+                self.counts["errors"] += 1
+                return 503
+            self.counts["ok"] += 1
+            return 200
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload, headers=()):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in headers:
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            status = state.admit()
+            if status == 429:
+                return self._send(429, {"code": "Throttling"}, [("Retry-After", "1")])
+            time.sleep(state.latency)
+            if status != 200:
+                return self._send(status, {"code": "ServiceUnavailable"})
+            if self.path.endswith("/chat/completions"):
+                return self._send(200, {
+                    "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": "stub",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": json.dumps(ARTICLE)}}],
+                })
+            if self.path.endswith("/SpeechAssessment"):
+                return self._send(200, ASSESSMENT)
+            self._send(404, {"code": "NotFound"})
+
+    return Handler
+
+
+def start(port=0, rps=5.0, burst=5, latency=0.2, error_rate=0.0):
+    """
+    Starts the stub on a daemon thread. Returns (server, state); the bound
+    port is server.server_address[1].
+    """
+    state = StubState(rps, burst, latency, error_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--rps", type=float, default=5.0)
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server, state = start(args.port, args.rps, args.burst, args.latency, args.error_rate)
+    print(f"Stub listening on http://127.0.0.1:{server.server_address[1]} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(state.counts)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
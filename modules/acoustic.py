@@ -0,0 +1,261 @@
+"""
+Acoustic pronunciation scoring: compares a learner recording with the TTS
+reference for the same sentence, without any speech recognizer.
+
+Both signals become MFCC (+delta) frames computed with NumPy/SciPy and are
+aligned with DTW (dtw-python). Each reference word's span (from Edge TTS
+WordBoundary events, or a proportional split when those are unavailable)
+is projected through the warping path onto the recording, which gives
+per-word timing, a per-word acoustic distance and a fluency estimate.
+Reference features are cached per sentence.
+"""
+import math
+from functools import lru_cache
+
+import numpy as np
+from scipy.fft import dct, rfft
+from scipy.spatial.distance import cdist
+from dtw import dtw
+
+from modules import audio_io
+from modules.cache import TTLCache, SingleFlight
+
+SAMPLE_RATE = audio_io.TARGET_SAMPLE_RATE
+FRAME_LEN = 400       # 25 ms
+HOP = 160             # 10 ms -> 100 frames per second
+N_FFT = 512
+N_MELS = 40
+N_MFCC = 13
+FRAMES_PER_SECOND = SAMPLE_RATE / HOP
+# Frames quieter than the loudest frame by this many dB count as silence
+SILENCE_DB = 35.0
+# Pauses inside the utterance longer than this many frames cost fluency
+LONG_PAUSE_FRAMES = 30
+
+# Rough calibration of the per-frame distance (CMVN-normalized MFCC+delta):
+# matching speech sits well below WORD_COST_MID, unrelated speech well above.
+# It scales the overall score; a learner's voice never matches the TTS voice
+# exactly, so words are judged against the utterance's own median cost.
+WORD_COST_MID = 6.0
+WORD_COST_SPREAD = 1.0
+# A word costing this many times the utterance median scores 50
+RELATIVE_COST_MID = 1.5
+RELATIVE_COST_SPREAD = 0.15
+ERROR_WORD_SCORE = 60
+# A word squeezed below this share of its reference duration was most likely skipped
+MIN_DURATION_RATIO = 0.3
+
+
+@lru_cache(maxsize=8)
+def _mel_filterbank(sample_rate=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS):
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    mels = np.linspace(hz_to_mel(20.0), hz_to_mel(sample_rate / 2), n_mels + 2)
+    bins = np.floor((n_fft + 1) * mel_to_hz(mels) / sample_rate).astype(int)
+    fb = np.zeros((n_mels, n_fft // 2 + 1), dtype=np.float32)
+    for m in range(1, n_mels + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        if center > left:
+            fb[m - 1, left:center] = (np.arange(left, center) - left) / (center - left)
+        if right > center:
+            fb[m - 1, center:right] = (right - np.arange(center, right)) / (right - center)
+    return fb
+
+
+def frame_features(samples):
+    """
+    Returns (features, frame_db): CMVN-normalized MFCC+delta frames of shape
+    (n_frames, 2 * (N_MFCC - 1)) and each frame's log energy in dB.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < FRAME_LEN:
+        samples = np.pad(samples, (0, FRAME_LEN - len(samples)))
+    emphasized = np.append(samples[0], samples[1:] - 0.97 * samples[:-1])
+    frames = np.lib.stride_tricks.sliding_window_view(emphasized, FRAME_LEN)[::HOP]
+    frames = frames * np.hamming(FRAME_LEN).astype(np.float32)
+
+    power = np.abs(rfft(frames, N_FFT, axis=1)) ** 2 / N_FFT
+    frame_db = 10 * np.log10(power.sum(axis=1) + 1e-10)
+    log_mel = np.log(power @ _mel_filterbank().T + 1e-10)
+    # Drop c0 (overall loudness) so recording level does not matter
+    mfcc = dct(log_mel, type=2, axis=1, norm="ortho")[:, 1:N_MFCC]
+    delta = np.gradient(mfcc, axis=0) if len(mfcc) > 1 else np.zeros_like(mfcc)
+    feats = np.hstack([mfcc, delta])
+    feats = (feats - feats.mean(axis=0)) / (feats.std(axis=0) + 1e-8)
+    return feats.astype(np.float32), frame_db
+
+
+def voiced_mask(frame_db):
+    return frame_db > frame_db.max() - SILENCE_DB
+
+
+def voiced_span(frame_db):
+    """
+    (first, last + 1) frame of speech, trimming leading/trailing silence.
+    """
+    idx = np.flatnonzero(voiced_mask(frame_db))
+    if not len(idx):
+        return 0, len(frame_db)
+    return int(idx[0]), int(idx[-1]) + 1
+
+
+def proportional_words(words, n_frames):
+    """
+    Splits n_frames across words in proportion to their length (used when
+    the TTS engine reports no word timings).
+    """
+    weights = np.array([len(w) + 1 for w in words], dtype=float)
+    edges = np.round(np.concatenate([[0], np.cumsum(weights)]) / weights.sum() * n_frames).astype(int)
+    return [(w, int(edges[i]), int(max(edges[i + 1], edges[i] + 1))) for i, w in enumerate(words)]
+
+
+def _logistic_score(value, mid, spread):
+    return 100.0 / (1.0 + math.exp(min(50.0, (value - mid) / spread)))
+
+
+class AcousticScorer:
+    def __init__(self, audio_gen=None, rate=1.0, cache_size=256, cache_ttl=7 * 24 * 3600):
+        self._audio_gen = audio_gen
+        self.rate = rate
+        # sentence -> prepared reference (features, word spans); shared across users
+        self.references = TTLCache(ttl=cache_ttl, max_entries=cache_size)
+        self._inflight = SingleFlight()
+
+    @property
+    def audio_gen(self):
+        if self._audio_gen is None:
+            # Standalone use (e.g. batch grading): references only need Edge TTS
+            from modules.audio_gen import AudioGenerator
+            self._audio_gen = AudioGenerator()
+        return self._audio_gen
+
+    def prepare_reference(self, audio, text, boundaries=None, sample_rate=None):
+        """
+        Builds the reference for text from its audio. boundaries: optional
+        [(word, start_s, end_s)] in the audio's timeline.
+        """
+        samples = audio_io.load_pcm(audio, sample_rate)
+        feats, frame_db = frame_features(samples)
+        start, end = voiced_span(frame_db)
+        if boundaries:
+            words = []
+            for word, t0, t1 in boundaries:
+                f0 = min(max(int(t0 * FRAMES_PER_SECOND) - start, 0), end - start - 1)
+                f1 = min(max(int(math.ceil(t1 * FRAMES_PER_SECOND)) - start, f0 + 1), end - start)
+                words.append((word, f0, f1))
+        else:
+            words = proportional_words(text.split(), end - start)
+        return {"features": feats[start:end], "words": words}
+
+    def reference(self, text):
+        key = (text, self.rate)
+        ref = self.references.get(key)
+        if ref is None:
+            ref = self._inflight.do(key, lambda: self._load_reference(key, text))
+        return ref
+
+    def _load_reference(self, key, text):
+        ref = self.references.get(key)
+        if ref is None:
+            audio, boundaries = self.audio_gen.reference_audio(text, rate=self.rate)
+            ref = self.prepare_reference(audio, text, boundaries)
+            self.references.put(key, ref)
+        return ref
+
+    def score(self, user_audio, reference_text, sample_rate=None, reference=None):
+        """
+        Scores a recording of reference_text. Returns the usual evaluation dict
+        plus "words" (per-word timing and score) and "distance".
+        reference: optional result of prepare_reference(); otherwise the TTS
+        reference for the sentence is fetched (once) and cached.
+        """
+        ref = reference or self.reference(reference_text)
+        samples = audio_io.load_pcm(user_audio, sample_rate)
+        feats, frame_db = frame_features(samples)
+        start, end = voiced_span(frame_db)
+        user = feats[start:end]
+        if len(user) < 2 or len(ref["features"]) < 2:
+            return {"total_score": 0, "fluency_score": 0, "integrity_score": 0,
+                    "error_words": [w for w, _, _ in ref["words"]], "words": [],
+                    "feedback": "No speech detected, please check your microphone."}
+
+        dist = cdist(user, ref["features"])
+        alignment = dtw(dist, step_pattern="symmetric2", distance_only=False)
+        path_user, path_ref = alignment.index1, alignment.index2
+        local_cost = dist[path_user, path_ref]
+
+        spans = []
+        for word, f0, f1 in ref["words"]:
+            mask = (path_ref >= f0) & (path_ref < f1)
+            if mask.any():
+                spans.append((word, f0, f1, mask, float(local_cost[mask].mean())))
+        baseline = float(np.median([c for *_, c in spans])) if spans else 0.0
+        # Overall closeness to the model reading scales every word score
+        closeness = _logistic_score(baseline, WORD_COST_MID, WORD_COST_SPREAD) / 100.0
+
+        offset = start / FRAMES_PER_SECOND
+        words, error_words = [], []
+        weighted, total_frames, intact = 0.0, 0, 0
+        for word, f0, f1, mask, cost in spans:
+            user_frames = path_user[mask]
+            u0, u1 = int(user_frames.min()), int(user_frames.max()) + 1
+            ratio = (u1 - u0) / max(1, f1 - f0)
+            relative = cost / max(baseline, 1e-6)
+            score = closeness * _logistic_score(relative, RELATIVE_COST_MID, RELATIVE_COST_SPREAD)
+            if ratio < MIN_DURATION_RATIO:
+                score = min(score, ERROR_WORD_SCORE - 1)
+            else:
+                intact += 1
+            if score < ERROR_WORD_SCORE:
+                error_words.append(word)
+            weighted += score * (f1 - f0)
+            total_frames += f1 - f0
+            words.append({
+                "word": word,
+                "start": round(offset + u0 / FRAMES_PER_SECOND, 3),
+                "end": round(offset + u1 / FRAMES_PER_SECOND, 3),
+                "ref_start": round(f0 / FRAMES_PER_SECOND, 3),
+                "ref_end": round(f1 / FRAMES_PER_SECOND, 3),
+                "duration_ratio": round(ratio, 2),
+                "score": int(round(score)),
+            })
+
+        total = int(round(weighted / total_frames)) if total_frames else 0
+        fluency = self._fluency(words, frame_db[start:end], len(user), len(ref["features"]))
+        integrity = int(round(100 * intact / len(ref["words"]))) if ref["words"] else 0
+
+        if total > 85:
+            feedback = "Excellent! Your rhythm and sounds closely match the model reading."
+        elif total > 60:
+            feedback = "Good effort! Compare the highlighted words with the model audio."
+        else:
+            feedback = "Keep practicing: listen to the model audio and try to match it word by word."
+        if fluency < 60:
+            feedback += " Try to speak more smoothly without long pauses."
+
+        return {
+            "total_score": total,
+            "fluency_score": fluency,
+            "integrity_score": integrity,
+            "error_words": error_words,
+            "feedback": feedback,
+            "words": words,
+            "distance": round(float(alignment.normalizedDistance), 3),
+        }
+
+    @staticmethod
+    def _fluency(words, frame_db, user_frames, ref_frames):
+        # Tempo: overall speed relative to the model; rhythm: how evenly words are stretched
+        tempo_penalty = 40 * abs(math.log(max(user_frames, 1) / max(ref_frames, 1)))
+        ratios = [w["duration_ratio"] for w in words if w["duration_ratio"] > 0]
+        rhythm_penalty = 30 * float(np.std(np.log(ratios))) if len(ratios) > 1 else 0.0
+        # Long silences inside the utterance
+        silent = ~voiced_mask(frame_db)
+        edges = np.diff(np.concatenate([[0], silent.astype(np.int8), [0]]))
+        runs = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+        pause_penalty = 5 * int((runs >= LONG_PAUSE_FRAMES).sum())
+        return int(max(0, min(100, round(100 - tempo_penalty - rhythm_penalty - pause_penalty))))
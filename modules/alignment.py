@@ -0,0 +1,390 @@
+"""
+Word alignment between a reference text and a recognized transcript.
+
+Both texts are tokenized with character offsets and normalized the same way
+(case, curly quotes, contractions, hyphenation, digits spelled out), so
+"don't" matches "do not" and "1990" matches "nineteen ninety". Unique
+tokens common to both sides anchor the alignment (patience diff); the gaps
+between anchors are aligned with Myers' O(ND) diff in linear space, so
+repeated function words cannot pull the match out of place the way
+difflib's junk heuristics do. The point is accuracy, not speed: with
+normalization and character offsets included it runs at roughly difflib's
+pace on Senior-length texts (a little slower on short or badly misread
+ones; see benchmarks/bench_alignment.py). Normalized tokens and reference
+texts are cached, which is where most of the time goes.
+"""
+import re
+from bisect import bisect_left
+from functools import lru_cache
+
+# Words with internal apostrophes, hyphens, and digit groups ("1,000", "3.5")
+_TOKEN = re.compile(r"\d+(?:[,.]\d+)*(?:st|nd|rd|th|%)?|[^\W\d_]+(?:['’\-][^\W\d_]+)*", re.UNICODE)
+
+CONTRACTIONS = {
+    "can't": ["can", "not"], "won't": ["will", "not"], "shan't": ["shall", "not"],
+    "ain't": ["is", "not"], "let's": ["let", "us"],
+}
+SUFFIXES = [("n't", ["not"]), ("'re", ["are"]), ("'ve", ["have"]), ("'ll", ["will"]),
+            ("'m", ["am"]), ("'d", ["would"])]
+# "'s" is only expanded after words where it cannot be a possessive
+S_IS = frozenset("it that what he she there here who where how this".split())
+
+ONES = ("zero one two three four five six seven eight nine ten eleven twelve thirteen "
+        "fourteen fifteen sixteen seventeen eighteen nineteen").split()
+TENS = "_ _ twenty thirty forty fifty sixty seventy eighty ninety".split()
+# Edit cost at which the middle-snake search settles for the furthest point
+# reached instead of the optimal split (as GNU diff does); keeps a badly
+# misread article from going quadratic at the price of a slightly longer diff
+TOO_EXPENSIVE = 256
+# Lengths of the unique runs tried as anchors, in order
+ANCHOR_NGRAMS = (1, 3)
+
+ORDINALS = {"one": "first", "two": "second", "three": "third", "five": "fifth",
+            "eight": "eighth", "nine": "ninth", "twelve": "twelfth"}
+SCALES = [(10 ** 9, "billion"), (10 ** 6, "million"), (1000, "thousand")]
+
+
+def _under_thousand(n):
+    words = []
+    if n >= 100:
+        words += [ONES[n // 100], "hundred"]
+        n %= 100
+    if n >= 20:
+        words.append(TENS[n // 10])
+        n %= 10
+        if n:
+            words.append(ONES[n])
+    elif n or not words:
+        words.append(ONES[n])
+    return words
+
+
+def number_words(n):
+    """
+    Spells out a non-negative integer the way it is usually read aloud;
+    year-like numbers are read in pairs ("nineteen ninety", "twenty twenty").
+    """
+    if 1100 <= n <= 1999 or 2010 <= n <= 2099:
+        high, low = divmod(n, 100)
+        if low == 0:
+            return _under_thousand(high) + ["hundred"]
+        return _under_thousand(high) + (["oh", ONES[low]] if low < 10 else _under_thousand(low))
+    words = []
+    for value, name in SCALES:
+        if n >= value:
+            words += number_words(n // value) + [name]
+            n %= value
+    if n or not words:
+        words += _under_thousand(n)
+    return words
+
+
+def _ordinal(words):
+    last = words[-1]
+    if last in ORDINALS:
+        last = ORDINALS[last]
+    elif last.endswith("y"):
+        last = last[:-1] + "ieth"
+    else:
+        last += "th"
+    return words[:-1] + [last]
+
+
+def _normalize_number(token):
+    suffix = ""
+    match = re.match(r"(.*?)(st|nd|rd|th|%)$", token)
+    if match:
+        token, suffix = match.groups()
+    token = token.replace(",", "")
+    whole, _, fraction = token.partition(".")
+    words = number_words(int(whole))
+    if fraction:
+        words += ["point"] + [ONES[int(d)] for d in fraction]
+    if suffix == "%":
+        words.append("percent")
+    elif suffix:
+        words = _ordinal(words)
+    return words
+
+
+@lru_cache(maxsize=16384)
+def normalize_token(token):
+    """
+    Returns the tuple of normalized words one written token stands for.
+    Cached: most tokens of an article (and of its transcript) repeat.
+    """
+    token = token.lower().replace("’", "'")
+    if token[0].isdigit():
+        return tuple(_normalize_number(token))
+    words = []
+    for part in token.split("-"):
+        if part in CONTRACTIONS:
+            words += CONTRACTIONS[part]
+            continue
+        for suffix, expansion in SUFFIXES:
+            if part.endswith(suffix) and len(part) > len(suffix):
+                words += [part[:-len(suffix)]] + expansion
+                break
+        else:
+            if part.endswith("'s") and part[:-2] in S_IS:
+                words += [part[:-2], "is"]
+            else:
+                words.append(part.replace("'", ""))
+    return tuple(w for w in words if w)
+
+
+def tokenize(text):
+    """
+    Returns [(raw_token, start, end, normalized_words)] for every word in text.
+    """
+    tokens = []
+    for m in _TOKEN.finditer(text or ""):
+        raw = m.group()
+        tokens.append((raw, *m.span(), normalize_token(raw)))
+    return tokens
+
+
+@lru_cache(maxsize=32)
+def reference_tokens(text):
+    """
+    tokenize() for reference texts, cached: a class reading one article
+    (or one recording scored in segments) shares the same reference.
+    """
+    return tuple(tokenize(text))
+
+
+# --- Diff over integer sequences ---
+
+def _myers(a, b, a0, a1, b0, b1, out):
+    """
+    Appends matched (i, j) pairs of a[a0:a1] / b[b0:b1] to out, in order.
+    Linear-space Myers: find the middle snake, recurse on both halves.
+    """
+    while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+        out.append((a0, b0))
+        a0 += 1
+        b0 += 1
+    tail = []
+    while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+        a1 -= 1
+        b1 -= 1
+        tail.append((a1, b1))
+    n, m = a1 - a0, b1 - b0
+    if n and m:
+        x, y, u, v = _middle_snake(a, b, a0, b0, n, m)
+        _myers(a, b, a0, a0 + x, b0, b0 + y, out)
+        out.extend((a0 + k, b0 + k - x + y) for k in range(x, u))
+        _myers(a, b, a0 + u, a1, b0 + v, b1, out)
+    out.extend(reversed(tail))
+
+
+def _middle_snake(a, b, a0, b0, n, m):
+    delta = n - m
+    odd = delta & 1
+    size = n + m + 2
+    forward = [0] * (2 * size + 1)
+    backward = [0] * (2 * size + 1)
+    for d in range((n + m + 1) // 2 + 1):
+        if d > TOO_EXPENSIVE:
+            split = _furthest_point(forward, backward, size, d - 1, n, m)
+            if split:
+                return split
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[size + k - 1] < forward[size + k + 1]):
+                x = forward[size + k + 1]
+            else:
+                x = forward[size + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            forward[size + k] = x
+            if odd and delta - (d - 1) <= k <= delta + (d - 1) and x + backward[size + delta - k] >= n:
+                return x_start, y_start, x, y
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[size + k - 1] < backward[size + k + 1]):
+                x = backward[size + k + 1]
+            else:
+                x = backward[size + k - 1] + 1
+            y = x - k
+            x_end, y_end = x, y
+            while x < n and y < m and a[a0 + n - x - 1] == b[b0 + m - y - 1]:
+                x += 1
+                y += 1
+            backward[size + k] = x
+            if not odd and -d <= delta - k <= d and x + forward[size + delta - k] >= n:
+                return n - x, m - y, n - x_end, m - y_end
+    return 0, 0, 0, 0
+
+
+def _furthest_point(forward, backward, size, d, n, m):
+    # Point of either search that advanced furthest along both sequences
+    # (progress measured on the one it is behind in), as a zero-length snake
+    points = [(forward[size + k], forward[size + k] - k) for k in range(-d, d + 1, 2)]
+    points += [(n - backward[size + k], m - backward[size + k] + k) for k in range(-d, d + 1, 2)]
+    points = [(x, y) for x, y in points if 0 <= x <= n and 0 <= y <= m and 0 < x + y < n + m]
+    if not points:
+        return None
+    x, y = max(points, key=lambda p: max(min(p[0] * m, p[1] * n), min((n - p[0]) * m, (m - p[1]) * n)))
+    return x, y, x, y
+
+
+def _unique_anchors(a, b, a0, a1, b0, b1, k=1):
+    """
+    (i, j) starts of k-grams occurring exactly once in each range, reduced to
+    the longest run increasing in both (patience sorting), non-overlapping.
+    """
+    in_a, in_b = {}, {}
+    for i in range(a0, a1 - k + 1):
+        key = a[i] if k == 1 else tuple(a[i:i + k])
+        in_a[key] = None if key in in_a else i
+    for j in range(b0, b1 - k + 1):
+        key = b[j] if k == 1 else tuple(b[j:j + k])
+        if in_a.get(key) is not None:
+            in_b[key] = None if key in in_b else j
+    pairs = sorted((in_a[key], j) for key, j in in_b.items() if j is not None)
+
+    tails, tail_idx, prev = [], [], [None] * len(pairs)
+    for idx, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos:
+            prev[idx] = tail_idx[pos - 1]
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(idx)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = idx
+    chain = []
+    idx = tail_idx[-1] if tail_idx else None
+    while idx is not None:
+        chain.append(pairs[idx])
+        idx = prev[idx]
+    anchors = []
+    for i, j in reversed(chain):
+        if not anchors or (i >= anchors[-1][0] + k and j >= anchors[-1][1] + k):
+            anchors.append((i, j))
+    return anchors
+
+
+def _patience(a, b, a0, a1, b0, b1, out):
+    # Most gaps between anchors are empty or read correctly: settle those
+    # without building anchor tables for them
+    while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+        out.append((a0, b0))
+        a0 += 1
+        b0 += 1
+    tail = []
+    while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+        a1 -= 1
+        b1 -= 1
+        tail.append((a1, b1))
+    if a0 < a1 and b0 < b1:
+        _patience_anchored(a, b, a0, a1, b0, b1, out)
+    out.extend(reversed(tail))
+
+
+def _patience_anchored(a, b, a0, a1, b0, b1, out):
+    # Unique words first; in text with few distinctive words, unique trigrams
+    for k in ANCHOR_NGRAMS:
+        anchors = _unique_anchors(a, b, a0, a1, b0, b1, k)
+        if anchors:
+            break
+    else:
+        _myers(a, b, a0, a1, b0, b1, out)
+        return
+    for i, j in anchors:
+        if i > a0 and j > b0:
+            _patience(a, b, a0, i, b0, j, out)
+        out.extend((i + t, j + t) for t in range(k))
+        a0, b0 = i + k, j + k
+    _patience(a, b, a0, a1, b0, b1, out)
+
+
+def diff(a, b):
+    """
+    Returns matched (i, j) index pairs of sequences a and b, in order.
+    This is a patience-anchored approximation, not necessarily a longest
+    common subsequence: committing to unique anchors can give up a longer
+    match elsewhere. Only the Myers diff between anchors is exact (and only
+    below TOO_EXPENSIVE). For a reading, the anchors follow what was
+    actually read, which is the alignment the error report wants.
+    """
+    ids = {}
+    a = [ids.setdefault(t, len(ids)) for t in a]
+    b = [ids.setdefault(t, len(ids)) for t in b]
+    out = []
+    _patience(a, b, 0, len(a), 0, len(b), out)
+    return out
+
+
+def align(reference_text, hypothesis_text):
+    """
+    Aligns a transcript against the reference. Returns:
+      {"words": [{"word", "start", "end", "status", "heard"}] per reference word,
+       "ratio": 2 * matched / (reference + hypothesis words), "matched", "inserted"}
+    status is "match", "substituted" (something else was heard in its place;
+    "heard" holds it) or "missing". start/end are character offsets into
+    reference_text.
+    """
+    ref = reference_tokens(reference_text)
+    hyp = tokenize(hypothesis_text)
+    ref_words = [(i, w) for i, tok in enumerate(ref) for w in tok[3]]
+    hyp_words = [(i, w) for i, tok in enumerate(hyp) for w in tok[3]]
+    pairs = diff([w for _, w in ref_words], [w for _, w in hyp_words])
+
+    matched = [0] * len(ref)
+    parts = [0] * len(ref)
+    for i, _ in ref_words:
+        parts[i] += 1
+    # For each unmatched reference word, the transcript words heard in its gap
+    heard = [None] * len(ref)
+    prev_i, prev_j = -1, -1
+    for i, j in pairs + [(len(ref_words), len(hyp_words))]:
+        if i > prev_i + 1 and j > prev_j + 1:
+            gap = " ".join(hyp[t][0] for t in dict.fromkeys(h for h, _ in hyp_words[prev_j + 1:j]))
+            for r, _ in ref_words[prev_i + 1:i]:
+                heard[r] = gap
+        if i < len(ref_words):
+            matched[ref_words[i][0]] += 1
+        prev_i, prev_j = i, j
+
+    words = []
+    for idx, (raw, start, end, _) in enumerate(ref):
+        if matched[idx] == parts[idx]:
+            status = "match"
+        elif heard[idx]:
+            status = "substituted"
+        else:
+            status = "missing"
+        words.append({"word": raw, "start": start, "end": end, "status": status,
+                      "heard": heard[idx] if status == "substituted" else None})
+
+    total = len(ref_words) + len(hyp_words)
+    return {
+        "words": words,
+        "ratio": 2.0 * len(pairs) / total if total else 1.0,
+        "matched": len(pairs),
+        "inserted": len(hyp_words) - len(pairs),
+    }
+
+
+def rebase_spans(spans_per_text, texts, full_text):
+    """
+    Maps character spans given per piece of text (e.g. per evaluated segment)
+    onto full_text, whose words are the pieces' words in the same order.
+    """
+    full = [(start, end) for _, start, end, _ in reference_tokens(full_text)]
+    out = []
+    offset = 0
+    for spans, text in zip(spans_per_text, texts):
+        tokens = tokenize(text)
+        starts = [start for _, start, _, _ in tokens]
+        for start, end in spans:
+            first = bisect_left(starts, start)
+            last = bisect_left(starts, end) - 1
+            if offset + last < len(full) and first <= last:
+                out.append((full[offset + first][0], full[offset + last][1]))
+        offset += len(tokens)
+    return out
@@ -0,0 +1,102 @@
+"""
+In-memory audio normalization for evaluation: decode, downmix and resample
+recordings to 16 kHz mono PCM without temp files.
+"""
+import io
+import os
+import wave
+from math import gcd
+
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+TARGET_SAMPLE_RATE = 16000
+
+
+def _to_float(samples):
+    # Scale any PCM dtype to float32 in [-1, 1]
+    if samples.dtype == np.uint8:
+        return (samples.astype(np.float32) - 128.0) / 128.0
+    if np.issubdtype(samples.dtype, np.integer):
+        return samples.astype(np.float32) / float(np.iinfo(samples.dtype).max)
+    return samples.astype(np.float32)
+
+
+def _decode_bytes(data):
+    """
+    Decodes audio bytes to (float32 samples, sample_rate). WAV is parsed
+    directly; anything else (webm/ogg/mp3 from browsers) goes through pydub.
+    """
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        sample_rate, samples = wavfile.read(io.BytesIO(data))
+        return _to_float(samples), sample_rate
+
+    from pydub import AudioSegment
+    sound = AudioSegment.from_file(io.BytesIO(data))
+    samples = np.array(sound.get_array_of_samples())
+    if sound.channels > 1:
+        samples = samples.reshape((-1, sound.channels))
+    scale = float(1 << (8 * sound.sample_width - 1))
+    return samples.astype(np.float32) / scale, sound.frame_rate
+
+
+def read_bytes(source):
+    """
+    Returns the raw bytes of a path, bytes-like object or file-like object.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    if hasattr(source, "read"):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return source.read()
+    raise TypeError(f"Unsupported audio source: {type(source).__name__}")
+
+
+def load_pcm(source, sample_rate=None, target_rate=TARGET_SAMPLE_RATE):
+    """
+    Loads audio as mono float32 samples at target_rate.
+    source: file path, bytes, BytesIO/uploaded file, or a NumPy array
+            (shape (n,) or (n, channels); sample_rate is then required).
+    """
+    if isinstance(source, np.ndarray):
+        if not sample_rate:
+            raise ValueError("sample_rate is required for NumPy audio input")
+        samples = _to_float(source)
+    else:
+        samples, sample_rate = _decode_bytes(read_bytes(source))
+
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+
+    if sample_rate != target_rate:
+        g = gcd(int(sample_rate), int(target_rate))
+        samples = resample_poly(samples, target_rate // g, int(sample_rate) // g).astype(np.float32)
+    return samples
+
+
+def to_wav_bytes(samples, sample_rate=TARGET_SAMPLE_RATE):
+    """
+    Encodes mono float samples as 16-bit PCM WAV bytes.
+    """
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def normalize_recording(source, sample_rate=None):
+    """
+    Returns 16 kHz mono 16-bit WAV bytes for any supported source.
+    """
+    return to_wav_bytes(load_pcm(source, sample_rate))
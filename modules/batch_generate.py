@@ -0,0 +1,227 @@
+"""
+Pre-builds a curriculum library by generating articles for a grid of
+grades x topics concurrently and saving them into the LibraryStore.
+
+Progress is appended to a JSON-lines file, so an interrupted run picks up
+where it stopped: finished (grade, topic) pairs are skipped, failed ones are
+tried again.
+
+CLI:
+    python -m modules.batch_generate --grades "初中 (Junior) - 初二 (Grade 8)" \
+        --topics Space Cars "Ocean life" --concurrency 8 --rpm 300
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from modules.text_gen import TextGenerator, ANALYSIS_SECTIONS
+from modules.library_store import LibraryStore
+from modules.ratelimit import get_provider
+
+DEFAULT_BASE_URL = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+
+# Title check and save must not interleave, or two grades could claim the same title
+_save_lock = threading.Lock()
+
+
+def validate_article(data):
+    """
+    Returns a list of problems with a generated article (empty if it is usable).
+    """
+    if not isinstance(data, dict):
+        return ["response is not a JSON object"]
+    problems = []
+    for field in ("title", "content"):
+        if not isinstance(data.get(field), str) or not data[field].strip():
+            problems.append(f"missing or empty '{field}'")
+    if not isinstance(data.get('keywords', []), list):
+        problems.append("'keywords' is not a list")
+    analysis = data.get('analysis')
+    if not isinstance(analysis, dict):
+        problems.append("missing 'analysis' object")
+    else:
+        for section in _empty_sections(analysis):
+            problems.append(f"analysis section '{section}' is missing or empty")
+    return problems
+
+
+def _empty_sections(analysis):
+    return [s for s in ANALYSIS_SECTIONS if not isinstance(analysis.get(s), list) or not analysis[s]]
+
+
+def _repairable_sections(data):
+    """
+    Analysis sections to request again when they are all that is wrong with
+    data; None when the article itself has to be regenerated.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('analysis'), dict):
+        return None
+    missing = _empty_sections(data['analysis'])
+    return missing if missing and len(validate_article(data)) == len(missing) else None
+
+
+class ProgressLog:
+    """
+    Append-only JSON-lines record of finished jobs.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A run killed mid-write can leave a partial last line
+                        continue
+                    key = (entry.get('grade'), entry.get('topic'))
+                    if entry.get('status') == "done":
+                        self.done[key] = entry
+                    else:
+                        self.done.pop(key, None)
+
+    def is_done(self, grade, topic):
+        return (grade, topic) in self.done
+
+    def record(self, entry):
+        if entry.get('status') == "done":
+            self.done[(entry['grade'], entry['topic'])] = entry
+        if not self.path:
+            return
+        with self._lock:
+            with open(self.path, "a", encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+
+
+def _unique_title(store, data, grade, topic):
+    # Titles are unique in the library, so saving under a taken title would replace
+    # that article. Only a re-run of the same (grade, topic) may do so; anything else
+    # gets the grade appended, then a counter, until the title is free.
+    base = data['title'].strip()
+    level = grade.split(' - ')[-1]
+    title, n = base, 1
+    while True:
+        existing = store.get_by_title(title)
+        if existing is None or (existing.get('grade'), existing.get('topic')) == (grade, topic):
+            return title
+        title = f"{base} ({level})" if n == 1 else f"{base} ({level}, {n})"
+        n += 1
+
+
+def generate_one(text_gen, store, grade, topic, tags=(), pipeline=True, retries=2):
+    """
+    Generates, validates and saves one article, retrying with jittered backoff.
+    Request pacing and 429/5xx retries happen in the shared "dashscope" provider;
+    these retries cover rejected (invalid) articles and exhausted attempts.
+    When only analysis sections came back empty, a retry requests just those
+    sections for the article already written instead of a whole new one.
+    Returns a progress entry.
+    """
+    data, last_error = None, None
+    for attempt in range(retries + 1):
+        try:
+            missing = _repairable_sections(data)
+            if missing:
+                data['analysis'] = dict(data['analysis'],
+                                        **text_gen.analyze_text(data['content'], grade, sections=missing))
+            else:
+                # A retry must not be served the rejected article from the generation cache
+                data = text_gen.generate_text(grade, topic, fresh=attempt > 0, pipeline=pipeline)
+            problems = validate_article(data)
+            if problems:
+                raise ValueError("; ".join(problems))
+            data['grade'] = grade
+            data['topic'] = topic
+            data['tags'] = sorted(set(data.get('tags', [])) | set(tags))
+            with _save_lock:
+                data['title'] = _unique_title(store, data, grade, topic)
+                article_id = store.save(data)
+            return {"grade": grade, "topic": topic, "status": "done", "article_id": article_id,
+                    "title": data['title'], "attempts": attempt + 1, "at": time.time()}
+        except Exception as e:
+            last_error = e
+            if attempt < retries:
+                time.sleep(min(30.0, 2 ** attempt) * (0.5 + random.random()))
+    return {"grade": grade, "topic": topic, "status": "failed", "error": str(last_error),
+            "attempts": retries + 1, "at": time.time()}
+
+
+def run_batch(text_gen, store, grades, topics, concurrency=4, rpm=None, retries=2, tags=(),
+              pipeline=True, progress_path=None, on_result=None):
+    """
+    Generates every (grade, topic) pair not already recorded as done in
+    progress_path. Returns a dict of counts.
+    """
+    log = ProgressLog(progress_path)
+    jobs = [(g, t) for g in grades for t in topics]
+    pending = [(g, t) for g, t in jobs if not log.is_done(g, t)]
+    counts = {"total": len(jobs), "skipped": len(jobs) - len(pending), "done": 0, "failed": 0}
+    if rpm:
+        get_provider("dashscope").configure(rate=rpm / 60.0)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(generate_one, text_gen, store, g, t, tags, pipeline, retries)
+                   for g, t in pending]
+        for future in as_completed(futures):
+            entry = future.result()
+            log.record(entry)
+            counts[entry['status']] += 1
+            if on_result:
+                on_result(entry, counts)
+    return counts
+
+
+def _read_lines(path):
+    with open(path, "r", encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-generate articles for grades x topics into the library.")
+    parser.add_argument("--grades", nargs="+", default=[], help='Grade labels as used by the app, e.g. "高中 (Senior) - 高一 (Grade 10)"')
+    parser.add_argument("--grades-file", help="File with one grade label per line")
+    parser.add_argument("--topics", nargs="+", default=[])
+    parser.add_argument("--topics-file", help="File with one topic per line")
+    parser.add_argument("--db", default="library.db", help="Path to the library database")
+    parser.add_argument("--library", default="library.json", help="Legacy library.json, imported on first use")
+    parser.add_argument("--progress", default="batch_progress.jsonl", help="Resumable progress log")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=0, help="DashScope requests started per minute, analysis calls included (0 = provider default)")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--tags", nargs="*", default=[])
+    parser.add_argument("--single-call", action="store_true", help="Generate article and analysis in one request instead of the pipeline")
+    args = parser.parse_args(argv)
+
+    grades = args.grades + (_read_lines(args.grades_file) if args.grades_file else [])
+    topics = args.topics + (_read_lines(args.topics_file) if args.topics_file else [])
+    if not grades or not topics:
+        parser.error("at least one grade and one topic are required")
+
+    api_key = os.getenv("DASHSCOPE_API_KEY")
+    if not api_key:
+        parser.error("DASHSCOPE_API_KEY is not set")
+
+    text_gen = TextGenerator(api_key=api_key, base_url=DEFAULT_BASE_URL)
+    store = LibraryStore(db_path=args.db, legacy_json=args.library)
+
+    def report(entry, counts):
+        finished = counts['done'] + counts['failed']
+        detail = entry.get('title') if entry['status'] == "done" else entry.get('error')
+        print(f"[{finished}/{counts['total'] - counts['skipped']}] {entry['status']:<6} {entry['grade']} | {entry['topic']}: {detail}")
+
+    counts = run_batch(text_gen, store, grades, topics, args.concurrency, args.rpm or None, args.retries,
+                       args.tags, not args.single_call, args.progress, report)
+    print(f"Done: {counts['done']} generated, {counts['skipped']} already done, {counts['failed']} failed.")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
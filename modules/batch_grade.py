@@ -0,0 +1,255 @@
+"""
+Grades a whole class's recordings in one go and writes a CSV or JSON report.
+
+Recordings come from a directory (every audio file, all reading the same
+text given with --text/--text-file/--article-id) or from a manifest (CSV
+with a header, .json list or .jsonl) with one row per recording:
+    file, and text or article_id, plus an optional student column.
+Relative paths in a manifest are resolved against the manifest's folder.
+
+Recordings are evaluated concurrently. Threads suit the network-bound
+methods (Aliyun, Google) and Vosk, whose decoder runs outside the GIL;
+--processes spreads CPU-bound acoustic scoring across cores. Calls to
+Aliyun (and to Edge TTS for acoustic references) go through the shared
+rate limiter, optionally capped with --rpm.
+
+CLI:
+    python -m modules.batch_grade recordings/ --article-id 12 --method aliyun --out grades.csv
+    python -m modules.batch_grade --manifest class3.csv --method offline --out grades.json
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from modules.evaluation import Evaluator
+from modules.library_store import LibraryStore
+from modules.ratelimit import get_provider
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".webm", ".ogg", ".flac", ".aac")
+METHODS = ("local", "offline", "acoustic", "aliyun")
+# External service each method is rate-limited on
+RATE_LIMITED = {"aliyun": "aliyun_nls", "acoustic": "edge"}
+# Concurrent requests to the free Google recognizer (network-bound, no quota settings)
+LOCAL_WORKERS = 8
+REPORT_FIELDS = ["student", "file", "article_id", "method", "total_score", "fluency_score",
+                 "integrity_score", "error_words", "feedback", "error", "seconds"]
+
+# Per-process evaluator when grading with --processes
+_worker_evaluator = None
+
+
+def find_recordings(directory):
+    """
+    Returns the audio files directly inside directory, sorted by name.
+    """
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(AUDIO_EXTENSIONS))
+
+
+def read_manifest(path):
+    """
+    Returns manifest rows as dicts with "file" resolved to a path.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding='utf-8-sig') as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        elif path.endswith(".json"):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+    for i, row in enumerate(rows):
+        if not row.get('file'):
+            raise ValueError(f"{path}: row {i + 1} has no 'file'")
+        if not row.get('text') and not row.get('article_id'):
+            raise ValueError(f"{path}: row {i + 1} needs 'text' or 'article_id'")
+        row['file'] = os.path.join(base, row['file'])
+    return rows
+
+
+def build_jobs(rows, store=None):
+    """
+    Resolves each row's reference text (article contents are looked up once
+    per ID). Returns (jobs, problems): jobs are dicts with student, file,
+    article_id and text; problems are report entries for unusable rows.
+    """
+    articles = {}
+    jobs, problems = [], []
+    for row in rows:
+        job = {"student": row.get('student') or os.path.splitext(os.path.basename(row['file']))[0],
+               "file": row['file'], "article_id": row.get('article_id') or None, "text": row.get('text')}
+        if not job['text']:
+            try:
+                article_id = int(job['article_id'])
+            except (TypeError, ValueError):
+                article_id = None
+            if article_id not in articles:
+                article = store.get(article_id) if store and article_id is not None else None
+                articles[article_id] = article['content'] if article else None
+            job['text'] = articles[article_id]
+        if not job['text']:
+            problems.append(_entry(job, None, {"error": f"article {job['article_id']} not found"}, 0.0))
+        elif not os.path.isfile(job['file']):
+            problems.append(_entry(job, None, {"error": "recording not found"}, 0.0))
+        else:
+            jobs.append(job)
+    return jobs, problems
+
+
+def _entry(job, method, result, seconds):
+    entry = {"student": job['student'], "file": job['file'], "article_id": job['article_id'],
+             "method": method, "seconds": round(seconds, 2)}
+    for key in ("total_score", "fluency_score", "integrity_score", "error_words", "feedback", "error"):
+        entry[key] = result.get(key)
+    if result.get("simulated"):
+        # The recognizer was unreachable and the app fell back to a random score
+        entry['error'] = "speech recognition unavailable, score not real"
+    return entry
+
+
+def grade_one(evaluator, job, method):
+    """
+    Evaluates one recording; failures become an entry with "error" set.
+    """
+    start = time.perf_counter()
+    try:
+        with open(job['file'], "rb") as f:
+            result = evaluator.evaluate_audio(f.read(), job['text'], method=method)
+    except Exception as e:
+        result = {"error": str(e), "total_score": 0}
+    return _entry(job, method, result, time.perf_counter() - start)
+
+
+def _init_worker(rates):
+    global _worker_evaluator
+    _worker_evaluator = Evaluator()
+    for name, rate in rates.items():
+        get_provider(name).configure(rate=rate)
+
+
+def _grade_in_worker(job, method):
+    return grade_one(_worker_evaluator, job, method)
+
+
+def grade_batch(jobs, method="offline", workers=None, processes=False, rpm=None,
+                evaluator=None, on_result=None):
+    """
+    Grades every job concurrently. Returns entries in input order.
+    workers: pool size (default: the Aliyun provider's concurrency limit,
+             LOCAL_WORKERS for Google, otherwise the number of cores).
+    processes: use a process pool; each process has its own Evaluator, and rpm is
+               split evenly between them.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    provider = RATE_LIMITED.get(method)
+    if not workers:
+        if method == "aliyun":
+            workers = get_provider("aliyun_nls").concurrency.max_limit
+        elif method == "local":
+            workers = LOCAL_WORKERS
+        else:
+            workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+
+    entries = [None] * len(jobs)
+    if processes:
+        rates = {provider: rpm / 60.0 / workers} if provider and rpm else {}
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rates,))
+        submit = lambda job: pool.submit(_grade_in_worker, job, method)
+    else:
+        if provider and rpm:
+            get_provider(provider).configure(rate=rpm / 60.0)
+        evaluator = evaluator or Evaluator()
+        pool = ThreadPoolExecutor(max_workers=workers)
+        submit = lambda job: pool.submit(grade_one, evaluator, job, method)
+
+    with pool:
+        futures = {submit(job): i for i, job in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            entry = future.result()
+            entries[futures[future]] = entry
+            if on_result:
+                on_result(entry, done, len(jobs))
+    return entries
+
+
+def write_report(entries, path):
+    """
+    Writes entries as JSON (for a .json path) or CSV (error words space-separated).
+    """
+    with open(path, "w", encoding='utf-8', newline="") as f:
+        if path.endswith(".json"):
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+            return
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for entry in entries:
+            row = dict(entry)
+            row['error_words'] = " ".join(entry.get('error_words') or [])
+            writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade a batch of recordings and write a CSV/JSON report.")
+    parser.add_argument("directory", nargs="?", help="Folder of recordings that all read the same text")
+    parser.add_argument("--manifest", help="CSV/JSON/JSONL with file, text or article_id, and student per row")
+    parser.add_argument("--text", help="Reference text for every recording in the directory")
+    parser.add_argument("--text-file", help="File holding the reference text")
+    parser.add_argument("--article-id", type=int, help="Library article whose content is the reference text")
+    parser.add_argument("--method", choices=METHODS, default="offline")
+    parser.add_argument("--db", default="library.db", help="Path to the library database")
+    parser.add_argument("--library", default="library.json", help="Legacy library.json, imported on first use")
+    parser.add_argument("--out", default="grading_report.csv", help="Report path (.csv or .json)")
+    parser.add_argument("--workers", type=int, default=0, help="Concurrent evaluations (0 = automatic)")
+    parser.add_argument("--processes", action="store_true", help="Use worker processes (CPU-bound methods such as acoustic)")
+    parser.add_argument("--rpm", type=float, default=0, help="Rate-limited calls started per minute (0 = provider default)")
+    args = parser.parse_args(argv)
+
+    if bool(args.directory) == bool(args.manifest):
+        parser.error("give either a directory or --manifest")
+    if args.manifest:
+        try:
+            rows = read_manifest(args.manifest)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    else:
+        text = args.text
+        if args.text_file:
+            with open(args.text_file, "r", encoding='utf-8') as f:
+                text = f.read()
+        if not text and args.article_id is None:
+            parser.error("a directory needs --text, --text-file or --article-id")
+        rows = [{"file": path, "text": text, "article_id": args.article_id}
+                for path in find_recordings(args.directory)]
+    if not rows:
+        parser.error("no recordings found")
+
+    needs_library = any(not row.get('text') for row in rows)
+    store = LibraryStore(db_path=args.db, legacy_json=args.library) if needs_library else None
+    jobs, problems = build_jobs(rows, store)
+    for entry in problems:
+        print(f"skipped {entry['file']}: {entry['error']}")
+
+    def report(entry, done, total):
+        detail = entry['error'] or f"{entry['total_score']} ({entry['seconds']} s)"
+        print(f"[{done}/{total}] {entry['student']}: {detail}")
+
+    start = time.perf_counter()
+    entries = grade_batch(jobs, args.method, args.workers or None, args.processes, args.rpm or None,
+                          on_result=report)
+    elapsed = time.perf_counter() - start
+    write_report(entries + problems, args.out)
+
+    failed = sum(1 for e in entries if e['error'])
+    print(f"Done: {len(entries) - failed} graded, {failed + len(problems)} failed in {elapsed:.1f} s. Report: {args.out}")
+    return 1 if failed or problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
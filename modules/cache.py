@@ -0,0 +1,123 @@
+"""
+Small in-process caching helpers shared by the engines.
+
+TTLCache is a thread-safe, size-bounded LRU map whose entries expire after a
+fixed time. SingleFlight collapses concurrent calls for the same key into a
+single execution whose result (or exception) is handed to every caller.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, ttl=24 * 3600, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (expires_at, value), ordered from least to most recently used
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    do(key, fn): the first caller for key runs fn(); callers arriving while it
+    is still running wait for and share its outcome instead of calling fn again.
+    claim()/finish()/wait() expose the same protocol to leaders that cannot be
+    wrapped in a single call, such as a generator streaming its result.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def claim(self, key):
+        """
+        Returns (call, leader). The leader must call finish(key, call, ...) exactly once.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.shared += 1
+        return call, leader
+
+    def finish(self, key, call, result=None, error=None):
+        call.result = result
+        call.error = error
+        with self._lock:
+            self._calls.pop(key, None)
+        call.done.set()
+
+    @staticmethod
+    def wait(call):
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, fn):
+        call, leader = self.claim(key)
+        if leader:
+            try:
+                result = fn()
+            except BaseException as e:
+                self.finish(key, call, error=e)
+            else:
+                self.finish(key, call, result=result)
+        return self.wait(call)
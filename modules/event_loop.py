@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+
+class BackgroundLoop:
+    """
+    A long-lived asyncio event loop running on a daemon thread.
+    Coroutines can be submitted from any thread (e.g. concurrent Streamlit
+    sessions) and share the one loop instead of paying for asyncio.run()
+    setting up and tearing down a loop per call.
+    """
+    def __init__(self, name="background-loop"):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self._loop
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                ready = threading.Event()
+                loop = asyncio.new_event_loop()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._loop = loop
+                self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+        return self._loop
+
+    @property
+    def loop(self):
+        return self._ensure_started()
+
+    def submit(self, coro):
+        """
+        Schedules coro on the background loop (thread-safe).
+        Returns a concurrent.futures.Future with its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def run(self, coro, timeout=None):
+        """
+        Runs coro on the background loop and blocks until it finishes.
+        Must not be called from the loop thread itself.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("BackgroundLoop.run() called from its own loop thread")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stop(self):
+        with self._lock:
+            if self._loop is not None and self._thread is not None and self._thread.is_alive():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+            self._loop = None
+            self._thread = None
+
+
+_default_loop = BackgroundLoop()
+
+
+def get_background_loop():
+    """
+    Returns the process-wide BackgroundLoop shared by all engines.
+    """
+    return _default_loop
@@ -0,0 +1,71 @@
+"""
+Error highlighting for evaluation feedback.
+
+The article is tokenized once (cached per text) and the HTML is assembled
+in a single left-to-right pass from sorted character spans, so render time
+depends on the article length, not on how many words were missed, and
+highlights never touch markup inserted for an earlier word. Spans come
+straight from the evaluator (error_spans) when it reports positions;
+otherwise every occurrence of each error word is marked, as before.
+"""
+import re
+from functools import lru_cache
+from html import escape
+
+ERROR_STYLE = ("background-color: #ffcccc; color: #cc0000; padding: 0 2px; "
+               "border-radius: 3px; font-weight: bold;")
+
+_WORD = re.compile(r"\w+(?:['’\-]\w+)*")
+
+
+@lru_cache(maxsize=32)
+def token_index(text):
+    """
+    {lowercased word: ((start, end), ...)} for every word in text.
+    """
+    index = {}
+    for m in _WORD.finditer(text):
+        index.setdefault(m.group().lower(), []).append((m.start(), m.end()))
+    return {word: tuple(spans) for word, spans in index.items()}
+
+
+@lru_cache(maxsize=128)
+def word_spans(text, words):
+    """
+    Sorted spans of every occurrence of words (a frozenset) in text.
+    """
+    # Single letters are mostly recognition noise; "dont" also matches "don't"
+    matcher = frozenset(w.lower() for w in words if len(w) > 1)
+    spans = []
+    for word, occurrences in token_index(text).items():
+        if word in matcher or word.replace("'", "").replace("’", "") in matcher:
+            spans.extend(occurrences)
+    return tuple(sorted(spans))
+
+
+def highlight_html(text, spans=None, words=None, style=ERROR_STYLE):
+    """
+    Returns text as HTML with the given character spans (or, without spans,
+    every occurrence of words) wrapped in a highlighted <span>.
+    """
+    if not text:
+        return text or ""
+    if spans:
+        spans = sorted((max(0, s), min(len(text), e)) for s, e in spans if e > s)
+    elif words:
+        spans = word_spans(text, frozenset(words))
+    else:
+        return escape(text, quote=False)
+
+    parts = []
+    cursor = 0
+    for start, end in spans:
+        if start < cursor:           # overlapping span: keep what is left of it
+            start = cursor
+            if start >= end:
+                continue
+        parts.append(escape(text[cursor:start], quote=False))
+        parts.append(f'<span style="{style}">{escape(text[start:end], quote=False)}</span>')
+        cursor = end
+    parts.append(escape(text[cursor:], quote=False))
+    return "".join(parts)
@@ -0,0 +1,158 @@
+"""
+Incremental parser for a JSON object that arrives in chunks (e.g. a streamed
+chat completion).
+
+Top-level string fields are exposed while they are still being received, so
+`title` and `content` can be shown long before the closing brace; nested
+values (lists, objects) and scalars appear once they are complete.
+"""
+import json
+
+_SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self.fields = {}
+        self.complete = set()
+        self.done = False
+        self._buf = []
+        self._state = "start"
+        self._key = None
+        self._chars = []
+        self._escape = ""
+        # nested/scalar value bookkeeping
+        self._value = []
+        self._depth = 0
+        self._in_string = False
+        self._string_escape = False
+
+    def feed(self, chunk):
+        """
+        Consumes the next piece of text. Returns the set of top-level keys
+        whose value changed (partial strings included).
+        """
+        changed = set()
+        if not chunk:
+            return changed
+        self._buf.append(chunk)
+        for ch in chunk:
+            if self.done:
+                break
+            self._step(ch, changed)
+        if self._state == "string_value" and self._key is not None:
+            # Expose the partial string as received so far
+            partial = "".join(self._chars)
+            if self.fields.get(self._key) != partial:
+                self.fields[self._key] = partial
+                changed.add(self._key)
+        return changed
+
+    def text(self):
+        return "".join(self._buf)
+
+    def result(self):
+        """
+        Returns the fully parsed object. Raises ValueError if the text received
+        so far is not a complete JSON object.
+        """
+        raw = self.text()
+        start, end = raw.find("{"), raw.rfind("}")
+        if start < 0 or end < start:
+            raise ValueError("No JSON object in response")
+        return json.loads(raw[start:end + 1])
+
+    def _step(self, ch, changed):
+        state = self._state
+        if state == "start":
+            # Tolerate anything before the object, such as a markdown fence
+            if ch == "{":
+                self._state = "key_or_end"
+        elif state == "key_or_end":
+            if ch == '"':
+                self._chars = []
+                self._state = "key"
+            elif ch == "}":
+                self.done = True
+        elif state in ("key", "string_value"):
+            self._string_char(ch, changed)
+        elif state == "colon":
+            if ch == ":":
+                self._state = "value_start"
+        elif state == "value_start":
+            if ch in _WHITESPACE:
+                return
+            if ch == '"':
+                self._chars = []
+                self._state = "string_value"
+            else:
+                self._value = [ch]
+                self._depth = 1 if ch in "[{" else 0
+                self._in_string = False
+                self._string_escape = False
+                self._state = "nested" if self._depth else "scalar"
+        elif state == "nested":
+            self._value.append(ch)
+            if self._in_string:
+                if self._string_escape:
+                    self._string_escape = False
+                elif ch == "\\":
+                    self._string_escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if not self._depth:
+                    self._finish_value(json.loads("".join(self._value)), changed)
+        elif state == "scalar":
+            if ch in ",}" or ch in _WHITESPACE:
+                self._finish_value(json.loads("".join(self._value)), changed)
+                if ch == "}":
+                    self.done = True
+            else:
+                self._value.append(ch)
+
+    def _string_char(self, ch, changed):
+        if self._escape:
+            self._escape += ch
+            esc = self._escape
+            if esc[1] != "u":
+                self._chars.append(_SIMPLE_ESCAPES.get(ch, ch))
+                self._escape = ""
+            elif len(esc) == 6:
+                code = int(esc[2:], 16)
+                if 0xD800 <= code < 0xDC00:
+                    # High surrogate: wait for the low half (\\uDCxx)
+                    self._escape = esc + "\x00"
+                else:
+                    self._chars.append(chr(code))
+                    self._escape = ""
+            elif len(esc) == 13:
+                # "\\uD83D" + marker + "\\uDE00"
+                self._chars.append(json.loads('"' + esc[:6] + esc[7:] + '"'))
+                self._escape = ""
+            return
+        if ch == "\\":
+            self._escape = "\\"
+        elif ch == '"':
+            value = "".join(self._chars)
+            if self._state == "key":
+                self._key = value
+                self._state = "colon"
+            else:
+                self._finish_value(value, changed)
+        else:
+            self._chars.append(ch)
+
+    def _finish_value(self, value, changed):
+        self.fields[self._key] = value
+        self.complete.add(self._key)
+        changed.add(self._key)
+        self._key = None
+        self._value = []
+        self._state = "key_or_end"
@@ -0,0 +1,254 @@
+"""
+In-memory inverted index over the article library.
+
+Indexes title, content, keywords and analysis vocabulary with per-field
+weights and ranks matches with BM25. Tag and grade filters are applied
+against small side indexes. Attached to a LibraryStore, the index is
+updated incrementally on every save or delete, and before each lookup it
+catches up on articles saved or deleted by other processes.
+"""
+import re
+import math
+import heapq
+import threading
+from collections import defaultdict
+
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "keywords": 2.0,
+    "vocabulary": 2.0,
+    "content": 1.0,
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i in is it its of on or our
+she so that the their them they this to was we were what when which who will with you your
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def _stem(token):
+    # Deliberately light: fold common plural/possessive forms so "stars" finds "star"
+    if token.endswith("'s"):
+        token = token[:-2]
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """
+    Lowercases, splits into words, drops stopwords and applies light stemming.
+    """
+    if not text:
+        return []
+    return [_stem(t) for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _fields(item):
+    analysis = item.get('analysis') if isinstance(item.get('analysis'), dict) else {}
+    vocabulary = " ".join(
+        v.get('word', '') if isinstance(v, dict) else str(v) for v in analysis.get('vocabulary', [])
+    )
+    return {
+        "title": item.get('title', ''),
+        "keywords": " ".join(item.get('keywords', []) or []),
+        "vocabulary": vocabulary,
+        "content": item.get('content', ''),
+    }
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # term -> {doc_id: weighted term frequency}
+        self._postings = defaultdict(dict)
+        # doc_id -> terms it contributed (for removal on update)
+        self._doc_terms = {}
+        self._doc_len = {}
+        self._total_len = 0.0
+        self._tag_docs = defaultdict(set)
+        self._doc_tags = {}
+        self._doc_grade = {}
+        self._store = None
+        # store.version() the index was last synced to
+        self._version = None
+        # Set once the initial build has finished
+        self.ready = threading.Event()
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def attach(self, store, background=False):
+        """
+        Builds the index from a LibraryStore and subscribes to its changes.
+        background=True returns at once and builds on a daemon thread (decoding
+        every article takes a while on large libraries); check `ready` before
+        searching, since search() waits for the build to finish.
+        """
+        self._store = store
+        store.add_listener(self._on_change)
+        if background:
+            threading.Thread(target=self._build, name="search-index", daemon=True).start()
+        else:
+            self._build()
+        return self
+
+    def _build(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # The next search() retries the full build
+            print(f"Search index build failed: {e}")
+        finally:
+            self.ready.set()
+
+    def refresh(self):
+        """
+        Re-indexes articles saved since the last sync and drops deleted ones.
+        Costs one aggregate query when nothing changed.
+        """
+        if self._store is None:
+            return
+        with self._lock:
+            version = self._store.version()
+            if version == self._version:
+                return
+            # >= so writes sharing the previous timestamp are not missed
+            since = self._version[1] if self._version else None
+            for article_id, item in self._store.iter_articles(updated_since=since):
+                self.add(article_id, item)
+            if len(self._doc_terms) != version[0]:
+                live = self._store.ids()
+                for doc_id in [d for d in self._doc_terms if d not in live]:
+                    self.remove(doc_id)
+            self._version = version
+
+    def _on_change(self, article_id, item):
+        if not self.ready.is_set():
+            # Don't make the saving thread wait for the build; refresh() picks it up
+            return
+        if item is None:
+            self.remove(article_id)
+        else:
+            self.add(article_id, item)
+
+    def add(self, doc_id, item):
+        """
+        Indexes (or re-indexes) one article.
+        """
+        weighted = defaultdict(float)
+        for field, text in _fields(item).items():
+            weight = FIELD_WEIGHTS[field]
+            for term in tokenize(text):
+                weighted[term] += weight
+        length = sum(weighted.values())
+        tags = set(item.get('tags', []) or [])
+
+        with self._lock:
+            self.remove(doc_id)
+            for term, tf in weighted.items():
+                self._postings[term][doc_id] = tf
+            self._doc_terms[doc_id] = tuple(weighted)
+            self._doc_len[doc_id] = length
+            self._total_len += length
+            self._doc_tags[doc_id] = tags
+            for tag in tags:
+                self._tag_docs[tag].add(doc_id)
+            self._doc_grade[doc_id] = (item.get('grade') or '').lower()
+
+    def remove(self, doc_id):
+        with self._lock:
+            terms = self._doc_terms.pop(doc_id, None)
+            if terms is None:
+                return
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self._postings[term]
+            self._total_len -= self._doc_len.pop(doc_id, 0.0)
+            for tag in self._doc_tags.pop(doc_id, ()):
+                docs = self._tag_docs.get(tag)
+                if docs is not None:
+                    docs.discard(doc_id)
+                    if not docs:
+                        del self._tag_docs[tag]
+            self._doc_grade.pop(doc_id, None)
+
+    def tags(self):
+        self.refresh()
+        with self._lock:
+            return sorted(self._tag_docs)
+
+    def search(self, query="", tag=None, grade=None, limit=50, match_all=True):
+        """
+        Returns [(doc_id, score)] best first.
+        query: free text; with match_all every query term must occur in the article.
+               An empty query lists everything passing the filters (score 0).
+        tag: exact tag filter. grade: case-insensitive substring of the article's grade.
+        limit: maximum number of hits, or None for all of them (e.g. to paginate).
+        """
+        self.refresh()
+        terms = list(dict.fromkeys(tokenize(query)))
+        grade = grade.lower() if grade else None
+
+        with self._lock:
+            candidates = None
+            if tag:
+                candidates = self._tag_docs.get(tag, set())
+
+            if not terms:
+                docs = candidates if candidates is not None else self._doc_terms
+                if grade:
+                    docs = [d for d in docs if grade in self._doc_grade.get(d, '')]
+                ordered = sorted(docs) if limit is None else heapq.nsmallest(limit, docs)
+                return [(d, 0.0) for d in ordered]
+
+            postings = [self._postings.get(t, {}) for t in terms]
+            if match_all:
+                # Start from the most selective constraint and only probe the others,
+                # so the work is proportional to the smallest posting list
+                constraints = sorted(postings, key=len)
+                if candidates is not None:
+                    constraints.insert(0 if len(candidates) < len(constraints[0]) else 1, candidates)
+                docs = set(constraints[0])
+                for other in constraints[1:]:
+                    if not docs:
+                        break
+                    docs = {d for d in docs if d in other}
+            else:
+                docs = set().union(*postings)
+                if candidates is not None:
+                    docs &= candidates
+            if grade:
+                docs = {d for d in docs if grade in self._doc_grade.get(d, '')}
+            if not docs:
+                return []
+
+            n_docs = len(self._doc_terms)
+            avg_len = self._total_len / n_docs if n_docs else 1.0
+            scores = defaultdict(float)
+            for term_postings in postings:
+                df = len(term_postings)
+                if not df:
+                    continue
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for d in docs:
+                    tf = term_postings.get(d)
+                    if tf:
+                        norm = K1 * (1 - B + B * self._doc_len[d] / avg_len)
+                        scores[d] += idf * tf * (K1 + 1) / (tf + norm)
+
+        rank = lambda kv: (kv[1], -kv[0])
+        if limit is None:
+            return sorted(scores.items(), key=rank, reverse=True)
+        return heapq.nlargest(limit, scores.items(), key=rank)
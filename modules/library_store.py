@@ -0,0 +1,321 @@
+"""
+SQLite-backed article library.
+
+Replaces whole-file rewrites of library.json: each save is one atomic
+transaction, titles and tags are indexed, and many Streamlit sessions (or
+processes) can read and write concurrently. The first time a store is
+opened, articles from the legacy library.json are imported.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS article_tags (
+    tag TEXT NOT NULL,
+    article_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+    PRIMARY KEY (tag, article_id)
+);
+CREATE INDEX IF NOT EXISTS idx_article_tags_article ON article_tags(article_id);
+CREATE INDEX IF NOT EXISTS idx_articles_created ON articles(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_articles_updated ON articles(updated_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Lightweight per-article summary used by the paginated library listing,
+# so a page never has to decode full article bodies.
+SUMMARY_COLUMNS = (
+    ("word_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("snippet", "TEXT NOT NULL DEFAULT ''"),
+    ("tags_json", "TEXT NOT NULL DEFAULT '[]'"),
+)
+SNIPPET_CHARS = 200
+SCHEMA_VERSION = 2
+
+
+def summarize(item):
+    content = item.get('content', '') or ''
+    return {
+        "word_count": len(content.split()),
+        "snippet": content[:SNIPPET_CHARS],
+        "tags_json": json.dumps(list(item.get('tags', []) or []), ensure_ascii=False),
+    }
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        # IMMEDIATE takes the write lock up front so concurrent writers queue instead of failing
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class LibraryStore:
+    def __init__(self, db_path="library.db", legacy_json="library.json"):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._listeners = []
+        self._conn().executescript(SCHEMA)
+        self._upgrade_schema()
+        if legacy_json:
+            self.migrate_from_json(legacy_json)
+
+    def _conn(self):
+        # sqlite3 connections must not be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._conn())
+
+    def _upgrade_schema(self):
+        conn = self._conn()
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        with self._transaction() as conn:
+            existing = {r[1] for r in conn.execute("PRAGMA table_info(articles)")}
+            for name, decl in SUMMARY_COLUMNS:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE articles ADD COLUMN {name} {decl}")
+            # Backfill summaries for rows written before the columns existed
+            rows = conn.execute("SELECT id, data FROM articles").fetchall()
+            for article_id, data in rows:
+                summary = summarize(json.loads(data))
+                conn.execute("UPDATE articles SET word_count = ?, snippet = ?, tags_json = ? WHERE id = ?",
+                             (summary["word_count"], summary["snippet"], summary["tags_json"], article_id))
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def add_listener(self, callback):
+        """
+        Registers callback(article_id, item) to run after each committed save;
+        item is None when the article was deleted. Used to keep indexes in sync.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, article_id, item):
+        for callback in self._listeners:
+            try:
+                callback(article_id, item)
+            except Exception as e:
+                print(f"Library listener error: {e}")
+
+    def migrate_from_json(self, json_path):
+        """
+        One-time import of a legacy library.json. Later duplicates of a title
+        win, matching the old save_to_library behaviour. Returns the number
+        of articles imported (0 if already migrated or the file is missing).
+        The migration is only marked done once the file has actually been
+        imported, so a library.json shipped by a later deploy is still picked up.
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return 0
+        if not json_path or not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r", encoding='utf-8') as f:
+                items = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Library migration skipped, could not read {json_path}: {e}")
+            return 0
+        with self._transaction() as conn:
+            # Re-check inside the write lock in case another process migrated first
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+            for item in items:
+                if isinstance(item, dict) and item.get('title'):
+                    self._upsert(conn, item)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                         (json.dumps({"source": os.path.abspath(json_path), "count": len(items), "at": time.time()}),))
+        return len(items)
+
+    def _upsert(self, conn, item):
+        item = dict(item)
+        item.pop('id', None)
+        now = time.time()
+        data = json.dumps(item, ensure_ascii=False)
+        summary = summarize(item)
+        row = conn.execute("SELECT id FROM articles WHERE title = ?", (item['title'],)).fetchone()
+        if row:
+            article_id = row[0]
+            conn.execute("UPDATE articles SET data = ?, updated_at = ?, word_count = ?, snippet = ?, tags_json = ? "
+                         "WHERE id = ?",
+                         (data, now, summary["word_count"], summary["snippet"], summary["tags_json"], article_id))
+            conn.execute("DELETE FROM article_tags WHERE article_id = ?", (article_id,))
+        else:
+            cur = conn.execute("INSERT INTO articles (title, data, created_at, updated_at, word_count, snippet, tags_json) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (item['title'], data, now, now,
+                                summary["word_count"], summary["snippet"], summary["tags_json"]))
+            article_id = cur.lastrowid
+        tags = {t for t in item.get('tags', []) if t}
+        conn.executemany("INSERT INTO article_tags (tag, article_id) VALUES (?, ?)",
+                         [(t, article_id) for t in tags])
+        return article_id
+
+    def save(self, item):
+        """
+        Inserts or replaces (by title) one article atomically. Returns its id.
+        """
+        if not item.get('title'):
+            raise ValueError("Article must have a title")
+        with self._transaction() as conn:
+            article_id = self._upsert(conn, item)
+        self._notify(article_id, item)
+        return article_id
+
+    def save_many(self, items):
+        """
+        Saves several articles in a single transaction. Returns their ids.
+        """
+        with self._transaction() as conn:
+            ids = [self._upsert(conn, item) for item in items]
+        for article_id, item in zip(ids, items):
+            self._notify(article_id, item)
+        return ids
+
+    def get(self, article_id):
+        row = self._conn().execute("SELECT data FROM articles WHERE id = ?", (article_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, article_ids):
+        """
+        Returns the articles for article_ids, in the given order (missing ids skipped).
+        """
+        if not article_ids:
+            return []
+        found = {}
+        ids = list(article_ids)
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for article_id, data in self._conn().execute(
+                    f"SELECT id, data FROM articles WHERE id IN ({placeholders})", chunk):
+                found[article_id] = json.loads(data)
+        return [found[i] for i in ids if i in found]
+
+    def iter_articles(self, updated_since=None):
+        """
+        Yields (id, article) for every article, oldest first; with updated_since,
+        only articles saved at or after that time.
+        """
+        if updated_since is None:
+            rows = self._conn().execute("SELECT id, data FROM articles ORDER BY created_at, id")
+        else:
+            rows = self._conn().execute("SELECT id, data FROM articles WHERE updated_at >= ? "
+                                        "ORDER BY created_at, id", (updated_since,))
+        for article_id, data in rows:
+            yield article_id, json.loads(data)
+
+    def ids(self):
+        return {r[0] for r in self._conn().execute("SELECT id FROM articles")}
+
+    def version(self):
+        """
+        (article count, latest updated_at): changes whenever any process saves
+        or deletes an article, so readers can tell when to catch up.
+        """
+        return tuple(self._conn().execute(
+            "SELECT COUNT(*), COALESCE(MAX(updated_at), 0) FROM articles").fetchone())
+
+    def get_by_title(self, title):
+        row = self._conn().execute("SELECT data FROM articles WHERE title = ?", (title,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list(self, tag=None):
+        """
+        Returns all articles (optionally only those with tag), oldest first.
+        """
+        if tag:
+            rows = self._conn().execute(
+                "SELECT a.data FROM articles a JOIN article_tags t ON t.article_id = a.id "
+                "WHERE t.tag = ? ORDER BY a.created_at, a.id", (tag,))
+        else:
+            rows = self._conn().execute("SELECT data FROM articles ORDER BY created_at, id")
+        return [json.loads(r[0]) for r in rows]
+
+    @staticmethod
+    def _summary_row(row):
+        article_id, title, word_count, snippet, tags_json = row
+        return {"id": article_id, "title": title, "word_count": word_count,
+                "snippet": snippet, "tags": json.loads(tags_json)}
+
+    def summaries(self, tag=None, offset=0, limit=20):
+        """
+        Returns one page of article summaries (id, title, tags, word_count,
+        snippet), oldest first, without loading article bodies.
+        """
+        cols = "a.id, a.title, a.word_count, a.snippet, a.tags_json"
+        if tag:
+            rows = self._conn().execute(
+                f"SELECT {cols} FROM articles a JOIN article_tags t ON t.article_id = a.id "
+                "WHERE t.tag = ? ORDER BY a.created_at, a.id LIMIT ? OFFSET ?", (tag, limit, offset))
+        else:
+            rows = self._conn().execute(
+                f"SELECT {cols} FROM articles a ORDER BY a.created_at, a.id LIMIT ? OFFSET ?", (limit, offset))
+        return [self._summary_row(r) for r in rows]
+
+    def summaries_for(self, article_ids):
+        """
+        Returns summaries for article_ids, in the given order (e.g. search ranking).
+        """
+        found = {}
+        ids = list(article_ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self._conn().execute(
+                    f"SELECT id, title, word_count, snippet, tags_json FROM articles WHERE id IN ({placeholders})", chunk):
+                found[row[0]] = self._summary_row(row)
+        return [found[i] for i in ids if i in found]
+
+    def tags(self):
+        return [r[0] for r in self._conn().execute("SELECT DISTINCT tag FROM article_tags ORDER BY tag")]
+
+    def count(self, tag=None):
+        if tag:
+            return self._conn().execute("SELECT COUNT(*) FROM article_tags WHERE tag = ?", (tag,)).fetchone()[0]
+        return self._conn().execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def delete(self, title):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT id FROM articles WHERE title = ?", (title,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM articles WHERE id = ?", (row[0],))
+        if row:
+            self._notify(row[0], None)
+        return bool(row)
+
+    def export_json(self, json_path):
+        """
+        Writes the whole library as a library.json-compatible file (atomically).
+        """
+        tmp_path = f"{json_path}.tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump(self.list(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, json_path)
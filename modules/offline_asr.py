@@ -0,0 +1,107 @@
+"""
+On-box speech recognition with Vosk (Kaldi), CPU only.
+
+The acoustic model is loaded once per process and shared by every
+Evaluator and thread; each decode gets its own lightweight recognizer.
+Requires `pip install vosk` and an English model unpacked at
+VOSK_MODEL_PATH (default: models/vosk-model-small-en-us-0.15), e.g. from
+https://alphacephei.com/vosk/models.
+"""
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from modules import audio_io
+
+DEFAULT_MODEL_PATH = os.path.join("models", "vosk-model-small-en-us-0.15")
+# Samples fed to the recognizer per call (0.25 s at 16 kHz)
+FEED_SAMPLES = 4000
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def model_path(path=None):
+    return path or os.getenv("VOSK_MODEL_PATH") or DEFAULT_MODEL_PATH
+
+
+def is_available(path=None):
+    """
+    True if vosk is installed and the model directory exists.
+    """
+    try:
+        import vosk  # noqa: F401
+    except ImportError:
+        return False
+    return os.path.isdir(model_path(path))
+
+
+def get_model(path=None):
+    """
+    Returns the process-wide vosk.Model for path, loading it on first use.
+    """
+    path = model_path(path)
+    model = _models.get(path)
+    if model is None:
+        with _models_lock:
+            model = _models.get(path)
+            if model is None:
+                import vosk
+                vosk.SetLogLevel(-1)
+                if not os.path.isdir(path):
+                    raise FileNotFoundError(f"Vosk model not found at {path} (set VOSK_MODEL_PATH)")
+                model = vosk.Model(path)
+                _models[path] = model
+    return model
+
+
+class OfflineRecognizer:
+    def __init__(self, model_path=None, sample_rate=audio_io.TARGET_SAMPLE_RATE):
+        self.model_path = model_path
+        self.sample_rate = sample_rate
+
+    def transcribe(self, audio, sample_rate=None):
+        """
+        Recognizes one recording (anything audio_io.load_pcm accepts).
+        Returns {"text": str, "words": [{"word", "start", "end", "conf"}]}.
+        """
+        import vosk
+        samples = audio_io.load_pcm(audio, sample_rate, self.sample_rate)
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+
+        recognizer = vosk.KaldiRecognizer(get_model(self.model_path), self.sample_rate)
+        recognizer.SetWords(True)
+        texts, words = [], []
+        for start in range(0, len(pcm), FEED_SAMPLES):
+            if recognizer.AcceptWaveform(pcm[start:start + FEED_SAMPLES].tobytes()):
+                self._collect(recognizer.Result(), texts, words)
+        self._collect(recognizer.FinalResult(), texts, words)
+        return {"text": " ".join(t for t in texts if t), "words": words}
+
+    @staticmethod
+    def _collect(raw, texts, words):
+        result = json.loads(raw)
+        texts.append(result.get("text", ""))
+        words.extend(result.get("result", []))
+
+    def transcribe_many(self, recordings, workers=None, sample_rate=None):
+        """
+        Decodes several recordings in parallel; the Kaldi decoder runs outside
+        the GIL, so threads scale across cores. Returns results in input order;
+        a recording that fails to decode yields {"text": "", "words": [], "error": ...}.
+        sample_rate: required when the recordings are NumPy arrays.
+        """
+        def run(audio):
+            try:
+                return self.transcribe(audio, sample_rate)
+            except Exception as e:
+                print(f"Offline ASR Error: {e}")
+                return {"text": "", "words": [], "error": str(e)}
+
+        recordings = list(recordings)
+        workers = workers or min(len(recordings), os.cpu_count() or 1) or 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(run, recordings))
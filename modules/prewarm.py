@@ -0,0 +1,159 @@
+"""
+Pre-renders library audio into the AudioGenerator cache so saved articles
+play instantly.
+
+CLI:
+    python -m modules.prewarm --db library.db --source edge --concurrency 4
+"""
+import os
+import sys
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from modules.audio_gen import AudioGenerator
+from modules.library_store import LibraryStore
+from modules.text_utils import get_shadowing_sentences
+
+# Speeds offered by the tab2 slider
+DEFAULT_SPEEDS = (0.75, 0.9, 1.0, 1.15)
+
+
+def build_jobs(items, speeds=DEFAULT_SPEEDS, sources=("edge",), bitrate="128k"):
+    """
+    Expands library items into (kind, text, rate, source, bitrate) jobs covering
+    the full text and every shadowing sentence, exactly as app.py requests them.
+    """
+    jobs = []
+    seen = set()
+    for item in items:
+        if not item.get('content'):
+            continue
+        texts = [("full", item['content'])]
+        texts += [("sentence", s) for s in get_shadowing_sentences(item) if s and s.strip()]
+        for source in sources:
+            for rate in speeds:
+                for kind, text in texts:
+                    key = (text, rate, source)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    jobs.append((kind, text, rate, source, bitrate))
+    return jobs
+
+
+def prewarm(audio_gen, items, speeds=DEFAULT_SPEEDS, sources=("edge",), bitrate="128k", concurrency=4, progress=None):
+    """
+    Synthesizes every missing full-text and sentence clip of items into the audio
+    cache using at most `concurrency` parallel requests.
+    progress: optional callback(done, total, job, status) with status in
+              "synthesized", "cached" or "failed".
+    Returns a dict of counts per status.
+    """
+    jobs = build_jobs(items, speeds, sources, bitrate)
+    counts = {"total": len(jobs), "synthesized": 0, "cached": 0, "failed": 0}
+
+    def run(job):
+        _, text, rate, source, job_bitrate = job
+        if audio_gen.is_cached(text, rate=rate, bitrate=job_bitrate, source=source):
+            return "cached"
+        audio_gen.warm(text, rate=rate, bitrate=job_bitrate, source=source)
+        # warm() never caches the mock fallback, so a miss afterwards means failure
+        return "synthesized" if audio_gen.is_cached(text, rate=rate, bitrate=job_bitrate, source=source) else "failed"
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(run, job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            job = futures[future]
+            try:
+                status = future.result()
+            except Exception as e:
+                print(f"Prewarm failed for {job[0]} @{job[2]}x: {e}")
+                status = "failed"
+            counts[status] += 1
+            if progress:
+                progress(done, len(jobs), job, status)
+    return counts
+
+
+class PrewarmWorker:
+    """
+    In-process background worker: articles enqueued after saving are rendered
+    into the cache on a daemon thread without blocking the Streamlit script.
+    """
+    def __init__(self, audio_gen, speeds=DEFAULT_SPEEDS, concurrency=2):
+        self.audio_gen = audio_gen
+        self.speeds = speeds
+        self.concurrency = concurrency
+        self.last_result = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="prewarm-worker", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, item, sources=("edge",)):
+        self._queue.put((dict(item), tuple(sources)))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            item, sources = self._queue.get()
+            try:
+                self.last_result = prewarm(self.audio_gen, [item], self.speeds, sources,
+                                           concurrency=self.concurrency)
+            except Exception as e:
+                print(f"Prewarm worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_prewarm_worker(audio_gen):
+    """
+    Returns the process-wide PrewarmWorker, creating it on first use.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = PrewarmWorker(audio_gen)
+        else:
+            _worker.audio_gen = audio_gen
+        return _worker
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render library audio into the TTS cache.")
+    parser.add_argument("--db", default="library.db", help="Path to the library database")
+    parser.add_argument("--library", default="library.json", help="Legacy library.json, imported on first use")
+    parser.add_argument("--output-dir", default="output", help="AudioGenerator output directory (cache lives in <dir>/cache)")
+    parser.add_argument("--speeds", type=float, nargs="+", default=list(DEFAULT_SPEEDS))
+    parser.add_argument("--source", nargs="+", choices=["qwen", "edge"], default=None,
+                        help="TTS engines to warm (default: qwen if DASHSCOPE_API_KEY is set, else edge)")
+    parser.add_argument("--bitrate", default="128k")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    api_key = os.getenv("DASHSCOPE_API_KEY")
+    sources = args.source or (["qwen"] if api_key else ["edge"])
+
+    items = LibraryStore(db_path=args.db, legacy_json=args.library).list()
+
+    audio_gen = AudioGenerator(output_dir=args.output_dir, api_key=api_key)
+
+    def report(done, total, job, status):
+        kind, text, rate, source, _ = job
+        print(f"[{done}/{total}] {status:<11} {source} {kind} @{rate}x  {text[:50]!r}")
+
+    counts = prewarm(audio_gen, items, args.speeds, sources, args.bitrate, args.concurrency, report)
+    print(f"Done: {counts['synthesized']} synthesized, {counts['cached']} already cached, {counts['failed']} failed.")
+    print(f"Cache: {audio_gen.cache_stats()}")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
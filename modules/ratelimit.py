@@ -0,0 +1,389 @@
+"""
+Client-side rate limiting and concurrency control for external services
+(DashScope chat and TTS, Edge TTS, Aliyun NLS).
+
+Every call to a provider goes through its Provider, which combines:
+- a token bucket that paces request starts to the provider's quota (and
+  slows below it while the service answers 429),
+- an AIMD concurrency limit that halves when the service throttles (429)
+  and creeps back up while calls succeed,
+- retries with full-jitter exponential backoff (honouring Retry-After) on
+  429, 5xx and connection errors,
+- a circuit breaker that fails fast after repeated server/connection
+  failures and lets a single probe through once it has cooled down.
+
+Limits come from PROVIDER_DEFAULTS and can be overridden with environment
+variables such as RATELIMIT_ALIYUN_NLS_RATE=10 or RATELIMIT_DASHSCOPE_MAX_CONCURRENCY=4.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+PROVIDER_DEFAULTS = {
+    # OpenAI-compatible chat completions (text generation and analysis)
+    "dashscope": {"rate": 5.0, "burst": 10, "max_concurrency": 8},
+    # Sambert speech synthesis
+    "dashscope_tts": {"rate": 3.0, "burst": 5, "max_concurrency": 4},
+    "edge": {"rate": 10.0, "burst": 10, "max_concurrency": 8},
+    # SpeechAssessment REST gateway
+    "aliyun_nls": {"rate": 5.0, "burst": 10, "max_concurrency": 8},
+}
+
+_SETTINGS = {
+    "rate": float, "burst": float, "max_concurrency": int, "min_concurrency": int,
+    "max_retries": int, "base_delay": float, "max_delay": float,
+    "failure_threshold": int, "reset_timeout": float,
+}
+
+
+class ServiceError(Exception):
+    """
+    Raised by call wrappers for a failed response that carries an HTTP-like status.
+    """
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def status_of(outcome):
+    """
+    HTTP status of a response or exception (requests/OpenAI/aiohttp/ServiceError), if any.
+    """
+    status = getattr(outcome, "status_code", None)
+    if status is None:
+        status = getattr(outcome, "status", None)
+    if status is None and getattr(outcome, "response", None) is not None:
+        status = getattr(outcome.response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_of(outcome):
+    value = getattr(outcome, "retry_after", None)
+    if value is None:
+        headers = getattr(outcome, "headers", None)
+        if headers is None and getattr(outcome, "response", None) is not None:
+            headers = getattr(outcome.response, "headers", None)
+        if headers:
+            value = headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_transient(exc):
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    # Client libraries define their own connection/timeout types (openai, aiohttp, requests)
+    name = type(exc).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+class TokenBucket:
+    """
+    Paces calls to `rate` per second with bursts up to `burst`. The rate adapts
+    below its configured ceiling when the service throttles and recovers
+    gradually afterwards, so it settles at the real quota.
+    """
+    def __init__(self, rate, burst):
+        self.ceiling = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token and returns how long to wait before using it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate) if self.rate > 0 else 0.0
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    def slow_down(self):
+        with self._lock:
+            self.rate = max(self.ceiling * 0.1, self.rate * 0.75)
+
+    def speed_up(self):
+        with self._lock:
+            self.rate = min(self.ceiling, self.rate + self.ceiling * 0.05)
+
+    def penalize(self, seconds):
+        # The service asked us to back off: nobody starts a new request for `seconds`
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        # The probe ended without telling us anything about the service's health
+        with self._lock:
+            self._probing = False
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on in-flight calls between min_limit and max_limit.
+    """
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def try_acquire(self):
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            if self.limit < self.max_limit:
+                # About +1 per window of `limit` successful calls
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            self.limit = max(float(self.min_limit), self.limit / 2)
+
+
+class Provider:
+    def __init__(self, name, rate=5.0, burst=10, max_concurrency=8, min_concurrency=1, max_retries=3,
+                 base_delay=0.5, max_delay=20.0, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrency(max_concurrency, min_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._stats_lock = threading.Lock()
+        self.counts = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0, "rejected": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.counts[name] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self.counts)
+        stats.update({"rate": round(self.bucket.rate, 2), "concurrency_limit": int(self.concurrency.limit),
+                      "in_flight": self.concurrency.in_flight,
+                      "circuit": self.breaker.state})
+        return stats
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError(f"{self.name}: circuit open after repeated failures")
+        self._count("calls")
+
+    def _backoff(self, attempt, retry_after):
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _outcome(self, result=None, error=None):
+        """
+        Classifies a finished attempt. Returns (retry, delay) and updates the
+        breaker, concurrency limit and bucket.
+        """
+        outcome = error if error is not None else result
+        status = status_of(outcome)
+        if status == 429:
+            self._count("throttled")
+            retry_after = retry_after_of(outcome)
+            self.concurrency.on_throttle()
+            self.bucket.slow_down()
+            if retry_after:
+                self.bucket.penalize(retry_after)
+            # Throttling means the service is up, so it does not count towards the breaker
+            self.breaker.release_probe()
+            return True, retry_after
+        if status in RETRYABLE_STATUS or (error is not None and status is None and _is_transient(error)):
+            self._count("failures")
+            self.breaker.record_failure()
+            return True, retry_after_of(outcome)
+        if error is not None:
+            self.breaker.release_probe()
+            return False, None
+        self.breaker.record_success()
+        self.concurrency.on_success()
+        self.bucket.speed_up()
+        return False, None
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) under this provider's limits, retrying on
+        throttling, 5xx and connection errors. A response object whose
+        status_code is still retryable after the last attempt is returned as is;
+        exceptions are re-raised. Raises CircuitOpenError while the circuit is open.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._admit()
+            self.bucket.acquire()
+            self.concurrency.acquire()
+            try:
+                result, error = fn(*args, **kwargs), None
+            except Exception as e:
+                result, error = None, e
+            finally:
+                self.concurrency.release()
+            retry, retry_after = self._outcome(result, error)
+            if not retry or attempt == self.max_retries:
+                if error is not None:
+                    raise error
+                return result
+            self._count("retries")
+            time.sleep(self._backoff(attempt, retry_after))
+
+    async def acall(self, fn, *args, **kwargs):
+        """
+        Asyncio counterpart of call() for coroutine functions; waits without
+        blocking the event loop.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._admit()
+            delay = self.bucket.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            while not self.concurrency.try_acquire():
+                await asyncio.sleep(0.05)
+            try:
+                result, error = await fn(*args, **kwargs), None
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                result, error = None, e
+            finally:
+                self.concurrency.release()
+            retry, retry_after = self._outcome(result, error)
+            if not retry or attempt == self.max_retries:
+                if error is not None:
+                    raise error
+                return result
+            self._count("retries")
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    def configure(self, rate=None, burst=None, max_concurrency=None):
+        """
+        Adjusts limits at runtime (e.g. a batch job given its own quota).
+        """
+        if rate is not None or burst is not None:
+            self.bucket = TokenBucket(rate if rate is not None else self.bucket.rate,
+                                      burst if burst is not None else self.bucket.burst)
+        if max_concurrency is not None:
+            self.concurrency.max_limit = max_concurrency
+            self.concurrency.limit = float(max_concurrency)
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def _env_settings(name):
+    settings = {}
+    prefix = f"RATELIMIT_{name.upper()}_"
+    for key, cast in _SETTINGS.items():
+        value = os.getenv(prefix + key.upper())
+        if value:
+            try:
+                settings[key] = cast(value)
+            except ValueError:
+                print(f"Ignoring invalid {prefix + key.upper()}={value!r}")
+    return settings
+
+
+def get_provider(name):
+    """
+    Returns the process-wide Provider for name, shared by every engine instance.
+    """
+    provider = _providers.get(name)
+    if provider is None:
+        with _providers_lock:
+            provider = _providers.get(name)
+            if provider is None:
+                settings = dict(PROVIDER_DEFAULTS.get(name, {}))
+                settings.update(_env_settings(name))
+                provider = Provider(name, **settings)
+                _providers[name] = provider
+    return provider
+
+
+def reset():
+    """
+    Drops all providers so the next get_provider() rereads the environment.
+    """
+    with _providers_lock:
+        _providers.clear()
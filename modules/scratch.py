@@ -0,0 +1,141 @@
+import io
+import os
+import time
+import uuid
+import shutil
+import threading
+
+SCRATCH_ROOT = os.path.join("output", "sessions")
+
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def sweep(root=SCRATCH_ROOT, ttl=3600, quota_bytes=1024 * 1024 * 1024):
+    """
+    Deletes session directories under root that have been idle for more than
+    ttl seconds, then the least recently used ones until the total size is
+    below quota_bytes. Returns the number of directories removed.
+    """
+    if not os.path.isdir(root):
+        return 0
+    now = time.time()
+    sessions = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        sessions.append([mtime, path, None])
+
+    removed = 0
+    alive = []
+    for entry in sessions:
+        if now - entry[0] > ttl:
+            shutil.rmtree(entry[1], ignore_errors=True)
+            removed += 1
+        else:
+            entry[2] = _dir_size(entry[1])
+            alive.append(entry)
+
+    total = sum(e[2] for e in alive)
+    for mtime, path, size in sorted(alive):
+        if total <= quota_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+class ScratchSpace:
+    """
+    Per-session scratch directory for generated and recorded audio.
+    Every path handed out is unique, so concurrent sessions (and workers
+    sharing a disk) never overwrite each other's files. Idle sessions are
+    swept after ttl seconds and the whole scratch root is kept under quota_bytes.
+    """
+    def __init__(self, session_id=None, root=SCRATCH_ROOT, ttl=3600,
+                 quota_bytes=1024 * 1024 * 1024, session_quota_bytes=100 * 1024 * 1024,
+                 sweep_interval=300):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.root = root
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.session_quota_bytes = session_quota_bytes
+        self.dir = os.path.join(root, self.session_id)
+        os.makedirs(self.dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._maybe_sweep(sweep_interval)
+
+    def _maybe_sweep(self, interval):
+        # Sweeping walks the whole root, so do it at most once per interval per process
+        global _last_sweep
+        with _sweep_lock:
+            if time.time() - _last_sweep < interval:
+                return
+            _last_sweep = time.time()
+        try:
+            sweep(self.root, self.ttl, self.quota_bytes)
+        except Exception as e:
+            print(f"Scratch sweep failed: {e}")
+        os.makedirs(self.dir, exist_ok=True)
+
+    def path(self, name):
+        """
+        Returns a fresh, unique path inside this session's directory,
+        e.g. path("speech.mp3") -> output/sessions/<id>/speech_<rand>.mp3
+        """
+        stem, ext = os.path.splitext(os.path.basename(name))
+        with self._lock:
+            # The directory may have been swept while the session was idle
+            os.makedirs(self.dir, exist_ok=True)
+            os.utime(self.dir, None)
+            self._enforce_session_quota()
+        return os.path.join(self.dir, f"{stem}_{uuid.uuid4().hex[:12]}{ext}")
+
+    def _enforce_session_quota(self):
+        files = []
+        for name in os.listdir(self.dir):
+            path = os.path.join(self.dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, path, st.st_size))
+        total = sum(f[2] for f in files)
+        for _, path, size in sorted(files):
+            if total <= self.session_quota_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    @staticmethod
+    def buffer(data=b""):
+        """
+        In-memory alternative to path() for audio that never needs to touch disk.
+        """
+        return io.BytesIO(data)
+
+    def usage(self):
+        return _dir_size(self.dir)
+
+    def cleanup(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
@@ -0,0 +1,93 @@
+"""
+Splits a long read-aloud recording into sentence-aligned segments.
+
+The reference text is packed into sentence groups of roughly equal length,
+each group's end is projected onto the recording in proportion to its
+share of the text, and the cut is snapped to the longest pause near that
+point. Readers pause between sentences far more than inside them, so cuts
+land on sentence boundaries without any speech recognition.
+"""
+import math
+
+import numpy as np
+
+from modules import audio_io
+from modules.text_utils import split_sentences, group_sentences
+
+FRAME_SECONDS = 0.01
+# Frames quieter than the loudest frame by this many dB count as silence
+SILENCE_DB = 35.0
+MIN_PAUSE_SECONDS = 0.2
+# Aim for segments of about this length (the evaluation latency per segment)
+TARGET_SEGMENT_SECONDS = 20.0
+# Search this far either side of the projected boundary for a pause
+SNAP_WINDOW_SECONDS = 4.0
+
+
+def frame_db(samples, sample_rate=audio_io.TARGET_SAMPLE_RATE):
+    hop = int(sample_rate * FRAME_SECONDS)
+    n = len(samples) // hop
+    if not n:
+        return np.full(1, -100.0)
+    frames = np.asarray(samples[:n * hop], dtype=np.float32).reshape(n, hop)
+    return 10 * np.log10((frames ** 2).mean(axis=1) + 1e-10)
+
+
+def find_pauses(samples, sample_rate=audio_io.TARGET_SAMPLE_RATE):
+    """
+    Returns [(center_seconds, length_seconds)] for every silence of at least
+    MIN_PAUSE_SECONDS inside the speech (leading/trailing silence excluded).
+    """
+    db = frame_db(samples, sample_rate)
+    silent = db <= db.max() - SILENCE_DB
+    voiced = np.flatnonzero(~silent)
+    if not len(voiced):
+        return []
+    first, last = voiced[0], voiced[-1]
+    edges = np.diff(np.concatenate([[0], silent[first:last + 1].astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1) + first
+    ends = np.flatnonzero(edges == -1) + first
+    min_frames = MIN_PAUSE_SECONDS / FRAME_SECONDS
+    return [((s + e) / 2 * FRAME_SECONDS, (e - s) * FRAME_SECONDS)
+            for s, e in zip(starts, ends) if e - s >= min_frames]
+
+
+def segment_recording(samples, reference_text, sample_rate=audio_io.TARGET_SAMPLE_RATE,
+                      target_seconds=TARGET_SEGMENT_SECONDS, max_chars=None):
+    """
+    Returns [(start_sample, end_sample, text)] covering the whole recording.
+    max_chars additionally caps each segment's text (e.g. an API text limit).
+    """
+    duration = len(samples) / sample_rate
+    sentences = split_sentences(reference_text)
+    if not sentences:
+        return [(0, len(samples), reference_text)]
+    total_chars = sum(len(s) for s in sentences)
+    n_segments = max(1, math.ceil(duration / target_seconds))
+    chunk_chars = max(1, math.ceil(total_chars / n_segments))
+    if max_chars:
+        chunk_chars = min(chunk_chars, max_chars)
+    groups = group_sentences(sentences, chunk_chars)
+    if len(groups) == 1:
+        return [(0, len(samples), groups[0])]
+
+    pauses = find_pauses(samples, sample_rate)
+    # Project boundaries within the spoken part, not the silence around it
+    db = frame_db(samples, sample_rate)
+    voiced = np.flatnonzero(db > db.max() - SILENCE_DB)
+    speech_start = voiced[0] * FRAME_SECONDS if len(voiced) else 0.0
+    speech_end = (voiced[-1] + 1) * FRAME_SECONDS if len(voiced) else duration
+    group_chars = sum(len(g) for g in groups)
+
+    cuts = []
+    consumed = 0
+    for group in groups[:-1]:
+        consumed += len(group)
+        expected = speech_start + (speech_end - speech_start) * consumed / group_chars
+        lower = cuts[-1] if cuts else 0.0
+        nearby = [(length, -abs(center - expected), center) for center, length in pauses
+                  if abs(center - expected) <= SNAP_WINDOW_SECONDS and center > lower]
+        cuts.append(max(nearby)[2] if nearby else max(expected, lower))
+
+    bounds = [0] + [int(c * sample_rate) for c in cuts] + [len(samples)]
+    return [(bounds[i], bounds[i + 1], group) for i, group in enumerate(groups)]
@@ -0,0 +1,81 @@
+"""
+Process-wide engine instances shared across Streamlit reruns and sessions.
+
+Streamlit re-executes app.py on every widget interaction; constructing
+TextGenerator/AudioGenerator/Evaluator each time throws away their HTTP
+connection pools, tokens and caches. These getters build one instance per
+credential set and hand the same object back afterwards.
+"""
+import hashlib
+import threading
+
+from modules.text_gen import TextGenerator
+from modules.audio_gen import AudioGenerator
+from modules.evaluation import Evaluator
+from modules.library_store import LibraryStore
+from modules.library_search import SearchIndex
+
+_instances = {}
+_lock = threading.Lock()
+
+
+def _fingerprint(*values):
+    # Credentials are only used as lookup keys, so keep hashes rather than the secrets
+    raw = "\x1f".join("" if v is None else str(v) for v in values)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _get_or_create(kind, key, factory):
+    cache_key = (kind, key)
+    instance = _instances.get(cache_key)
+    if instance is not None:
+        return instance
+    with _lock:
+        instance = _instances.get(cache_key)
+        if instance is None:
+            instance = factory()
+            _instances[cache_key] = instance
+        return instance
+
+
+def get_text_generator(api_key=None, base_url=None):
+    return _get_or_create("text", _fingerprint(api_key, base_url),
+                          lambda: TextGenerator(api_key=api_key, base_url=base_url))
+
+
+def get_audio_generator(api_key=None, output_dir="output"):
+    return _get_or_create("audio", _fingerprint(api_key, output_dir),
+                          lambda: AudioGenerator(output_dir=output_dir, api_key=api_key))
+
+
+def get_evaluator(app_key=None, ak_id=None, ak_secret=None, audio_gen=None):
+    """
+    audio_gen: the shared AudioGenerator the acoustic scorer synthesizes references with.
+    """
+    return _get_or_create("evaluator", _fingerprint(app_key, ak_id, ak_secret, audio_gen and id(audio_gen)),
+                          lambda: Evaluator(app_key=app_key, ak_id=ak_id, ak_secret=ak_secret,
+                                            audio_gen=audio_gen))
+
+
+def get_library_store(db_path="library.db", legacy_json="library.json"):
+    return _get_or_create("library", _fingerprint(db_path, legacy_json),
+                          lambda: LibraryStore(db_path=db_path, legacy_json=legacy_json))
+
+
+def get_search_index(db_path="library.db", legacy_json="library.json", background=False):
+    """
+    Inverted index over the shared library store, kept in sync on every save
+    and refreshed from the database before each search. background=True
+    builds it on a thread; see SearchIndex.attach.
+    """
+    store = get_library_store(db_path=db_path, legacy_json=legacy_json)
+    return _get_or_create("search", _fingerprint(db_path, legacy_json),
+                          lambda: SearchIndex().attach(store, background=background))
+
+
+def clear():
+    """
+    Drops all shared instances (e.g. after rotating credentials).
+    """
+    with _lock:
+        _instances.clear()
@@ -1,15 +1,74 @@
 import os
+import re
+import copy
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
+from modules.cache import TTLCache, SingleFlight
+from modules.json_stream import IncrementalJSONParser
+from modules.ratelimit import get_provider
+
+TEXT_MODEL = "qwen-turbo"
+TEXT_TEMPERATURE = 0.7
+# Bump when the prompts change so cached articles from older prompts are not served
+PROMPT_VERSION = 1
+
+# Requests per analysis section before it is left empty; the provider only
+# retries throttling/transient errors, not malformed output
+SECTION_ATTEMPTS = 2
+
+# Analysis sections produced by pipeline mode: name -> (requirement, JSON shape)
+ANALYSIS_SECTIONS = {
+    "vocabulary": (
+        "List 3-5 key words/phrases from the text with part of speech and Chinese meaning.",
+        '[{ "word": "word1", "pos": "noun", "meaning": "中文释义" }, ...]'),
+    "grammar": (
+        "List 2-3 key grammar points used in the text, each with an example sentence.",
+        '[{ "point": "Grammar rule", "example": "Example sentence" }, ...]'),
+    "expressions": (
+        "List 2-3 key expressions from the text with replacements and usage scenarios.",
+        '[{ "phrase": "phrase1", "replacement": "alternative", "scenario": "usage scenario" }, ...]'),
+    "easy_test": (
+        "Create 3 easy multiple-choice questions testing vocabulary or grammar from the text, "
+        "with answer keys and brief explanations.",
+        '[{ "question": "Question 1?", "options": ["A", "B", "C", "D"], "answer": "A", "explanation": "Why A is correct" }, ...]'),
+    "shadowing_sentences": (
+        "Extract exactly 5 key sentences from the text that are suitable for practicing intonation and "
+        "pronunciation. Copy them verbatim; they must be complete, representative sentences.",
+        '["Sentence 1...", "Sentence 2...", "Sentence 3...", "Sentence 4...", "Sentence 5..."]'),
+}
+
+
+class StreamAbandoned(Exception):
+    """
+    The streaming leader for a request was closed before finishing.
+    """
+
+
+def _normalize(value):
+    # "  Space  Travel " and "space travel" are the same request
+    return re.sub(r"\s+", " ", str(value or "")).strip().casefold()
+
 
 class TextGenerator:
-    def __init__(self, api_key=None, base_url=None):
+    def __init__(self, api_key=None, base_url=None, cache_ttl=24 * 3600, cache_max_entries=256):
         self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
         self.base_url = base_url
         if self.api_key:
-            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            # Retries are handled by the shared "dashscope" provider, not the SDK
+            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
         else:
             self.client = None
+        self.model = TEXT_MODEL
+        self.temperature = TEXT_TEMPERATURE
+        # Identical (grade, interest) requests are served from memory, and concurrent
+        # ones (double-clicks, a whole class asking for one topic) share a single call
+        self.cache = TTLCache(ttl=cache_ttl, max_entries=cache_max_entries)
+        # Analysis sections keyed by a hash of the text they describe
+        self.section_cache = TTLCache(ttl=cache_ttl, max_entries=cache_max_entries * len(ANALYSIS_SECTIONS))
+        self._inflight = SingleFlight()
+        self.limiter = get_provider("dashscope")
 
     def _get_constraints(self, grade):
         """
@@ -55,13 +114,226 @@ class TextGenerator:
 
         return constraints
 
-    def generate_text(self, grade, interest):
+    def _cache_key(self, grade, interest, pipeline=False):
+        payload = json.dumps([_normalize(grade), _normalize(interest), self.model,
+                              self.temperature, PROMPT_VERSION, "pipeline" if pipeline else "single"],
+                             ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def cache_stats(self):
+        stats = self.cache.stats()
+        stats["shared_inflight"] = self._inflight.shared
+        return stats
+
+    def generate_text(self, grade, interest, fresh=False, pipeline=False):
         """
         Generates English text using Qwen/OpenAI API.
+        Results are cached per normalized (grade, interest, model settings);
+        fresh=True skips the cache to get a new variant, which then replaces it.
+        pipeline=True writes the article first and then produces each analysis
+        section in its own concurrent, separately cached request (see analyze_text).
+        Returns a copy the caller may modify.
+        """
+        if not self.client:
+            raise ValueError("API Key is missing. Please configure it in the sidebar.")
+
+        key = self._cache_key(grade, interest, pipeline)
+        if fresh:
+            data = self._generate(grade, interest, pipeline)
+            self.cache.put(key, data)
+            return copy.deepcopy(data)
+
+        while True:
+            data = self.cache.get(key)
+            if data is not None:
+                data = self._complete_analysis(key, data, grade, pipeline)
+                break
+            try:
+                data = self._inflight.do(key, lambda: self._cached_generate(key, grade, interest, pipeline))
+                break
+            except StreamAbandoned:
+                continue  # we waited on a stream whose page went away: take over
+        return copy.deepcopy(data)
+
+    def _cached_generate(self, key, grade, interest, pipeline):
+        # A request that finished just before we became leader may already have filled the cache
+        data = self.cache.get(key)
+        if data is None:
+            data = self._generate(grade, interest, pipeline)
+            self.cache.put(key, data)
+        return data
+
+    def _complete_analysis(self, key, data, grade, pipeline):
+        # Sections that failed when a cached pipeline article was generated are
+        # requested again (alone) on the next hit, instead of serving them empty
+        if not pipeline:
+            return data
+        analysis = data.get('analysis') or {}
+        missing = [name for name in ANALYSIS_SECTIONS if not analysis.get(name)]
+        if not missing:
+            return data
+        filled = self.analyze_text(data.get('content', ''), grade, sections=missing)
+        if not any(filled.values()):
+            return data
+        # Replace rather than mutate: other callers may be copying the cached dict
+        data = dict(data, analysis=dict(analysis, **filled))
+        self.cache.put(key, data)
+        return data
+
+    def generate_text_stream(self, grade, interest, fresh=False, pipeline=False):
+        """
+        Streaming variant of generate_text. Yields (data, done) pairs: data holds
+        the fields received so far, with `title` and `content` growing as they
+        arrive and `analysis` filled in afterward; the last pair has done=True
+        and the complete article, which is also stored in the generation cache.
+        A cache hit yields the finished article at once. While an identical
+        request is already being generated, this waits for that article instead
+        of opening a second stream.
+        """
+        if not self.client:
+            raise ValueError("API Key is missing. Please configure it in the sidebar.")
+
+        key = self._cache_key(grade, interest, pipeline)
+        if fresh:
+            for data, done in self._stream_article(key, grade, interest, pipeline):
+                yield (copy.deepcopy(data) if done else data), done
+            return
+
+        while True:
+            data = self.cache.get(key)
+            if data is not None:
+                data = self._complete_analysis(key, data, grade, pipeline)
+                yield copy.deepcopy(data), True
+                return
+            # Identical requests in flight (streamed or not) share one LLM call;
+            # followers wait for the leader's finished article
+            call, leader = self._inflight.claim(key)
+            if leader:
+                break
+            try:
+                data = self._inflight.wait(call)
+            except StreamAbandoned:
+                continue  # the leader's page went away mid-stream: take over
+            yield copy.deepcopy(data), True
+            return
+
+        data = None
+        try:
+            for data, done in self._stream_article(key, grade, interest, pipeline):
+                yield (copy.deepcopy(data) if done else data), done
+        except GeneratorExit:
+            self._inflight.finish(key, call, error=StreamAbandoned(key))
+            raise
+        except BaseException as e:
+            self._inflight.finish(key, call, error=e)
+            raise
+        else:
+            self._inflight.finish(key, call, result=data)
+
+    def _stream_article(self, key, grade, interest, pipeline):
+        # The final (data, True) is the cached object itself; callers copy it
+        messages = self._build_article_messages(grade, interest) if pipeline else self._build_messages(grade, interest)
+        parser = IncrementalJSONParser()
+        try:
+            stream = self.limiter.call(
+                self.client.chat.completions.create,
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                response_format={"type": "json_object"},
+                stream=True
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if parser.feed(delta):
+                    yield dict(parser.fields), False
+            data = parser.result()
+        except Exception as e:
+            raise Exception(f"API Error: {str(e)}")
+
+        if pipeline:
+            data['analysis'] = self.analyze_text(data.get('content', ''), grade)
+        self.cache.put(key, data)
+        yield data, True
+
+    def _generate(self, grade, interest, pipeline=False):
+        if not pipeline:
+            return self._complete_json(self._build_messages(grade, interest))
+        data = self._complete_json(self._build_article_messages(grade, interest))
+        data['analysis'] = self.analyze_text(data.get('content', ''), grade)
+        return data
+
+    def _complete_json(self, messages):
+        try:
+            response = self.limiter.call(
+                self.client.chat.completions.create,
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                response_format={"type": "json_object"} # Ensure JSON output
+            )
+            
+            content_str = response.choices[0].message.content
+            return json.loads(content_str)
+            
+        except Exception as e:
+            # Fallback if model doesn't support json_object or specific model name error
+            # Try parsing manually if needed, but for now just re-raise with clarity
+            raise Exception(f"API Error: {str(e)}")
+
+    def analyze_text(self, content, grade="通用 (General)", sections=None):
+        """
+        Builds the `analysis` dict for an existing text (generated or imported)
+        with one concurrent request per section. Throttling and transient errors
+        are retried by the shared "dashscope" provider. Each section is cached
+        by a hash of the text, so after a failure only the failed sections are
+        requested again. A section that fails (e.g. malformed output, which the
+        provider does not retry) is requested once more on its own; if that
+        fails too it is left empty (and not cached).
         """
         if not self.client:
             raise ValueError("API Key is missing. Please configure it in the sidebar.")
+        pending = list(sections or ANALYSIS_SECTIONS)
+        analysis = {}
+        for attempt in range(SECTION_ATTEMPTS):
+            failed = []
+            with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+                futures = {name: pool.submit(self._analysis_section, name, content, grade) for name in pending}
+                for name, future in futures.items():
+                    try:
+                        analysis[name] = future.result()
+                    except Exception as e:
+                        print(f"Analysis section '{name}' failed (attempt {attempt + 1}): {e}")
+                        failed.append(name)
+            pending = failed
+            if not pending:
+                break
+        for name in pending:
+            analysis[name] = []
+        return analysis
+
+    def _analysis_section(self, section, content, grade):
+        payload = json.dumps([section, content, _normalize(grade), self.model, PROMPT_VERSION], ensure_ascii=False)
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        value = self.section_cache.get(key)
+        if value is None:
+            value = self._inflight.do(key, lambda: self._request_section(key, section, content, grade))
+        return copy.deepcopy(value)
+
+    def _request_section(self, key, section, content, grade):
+        value = self.section_cache.get(key)
+        if value is not None:
+            return value
+        # One attempt here: the provider inside _complete_json owns the retries
+        value = self._complete_json(self._build_section_messages(section, content, grade)).get(section)
+        if not isinstance(value, list):
+            raise ValueError(f"expected a list for '{section}'")
+        self.section_cache.put(key, value)
+        return value
 
+    def _build_messages(self, grade, interest):
         constraints = self._get_constraints(grade)
         
         system_prompt = f"""You are an expert English teacher and content creator. 
@@ -132,21 +404,63 @@ class TextGenerator:
         Put this structured analysis into the 'analysis' field of the JSON response, following the Output Format structure exactly.
         """
 
-        try:
-            response = self.client.chat.completions.create(
-                model="qwen-turbo", # Default to qwen-turbo or let user config. Using a safe default for Qwen.
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"} # Ensure JSON output
-            )
-            
-            content_str = response.choices[0].message.content
-            return json.loads(content_str)
-            
-        except Exception as e:
-            # Fallback if model doesn't support json_object or specific model name error
-            # Try parsing manually if needed, but for now just re-raise with clarity
-            raise Exception(f"API Error: {str(e)}")
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _build_article_messages(self, grade, interest):
+        """
+        Article-only prompt used by pipeline mode; the analysis is requested separately.
+        """
+        constraints = self._get_constraints(grade)
+
+        system_prompt = f"""You are an expert English teacher and content creator. 
+        Your task is to write an educational English article for a student.
+        
+        Target Audience: {grade}
+        Topic: {interest}
+        
+        Constraints:
+        1. Vocabulary: {constraints['vocab_level']}
+        2. Grammar: {constraints['grammar_level']}
+        3. Length: {constraints['length_desc']} (Target word count: {constraints['word_count']})
+        4. Style: Engaging, educational, and suitable for reading aloud (shadowing).
+        5. Language: The content must be authentic American English.
+        
+        Important Note on Topic:
+        If the user-provided topic '{interest}' is not in English (e.g., in Chinese), you MUST first translate it into idiomatic American English.
+        Use the translated English topic as the title and subject of the article.
+        
+        Output Format:
+        Return ONLY a raw JSON object (no markdown formatting) with the following structure:
+        {{
+            "title": "Title of the article (in English)",
+            "content": "The full article text (in authentic American English)...",
+            "keywords": ["word1", "word2", "word3"],
+            "chinese_translation": ["词义1", "词义2", "词义3"]
+        }}
+        """
+
+        user_prompt = f"""Please write an article about '{interest}' for a student in {grade}. strictly following the length constraint of {constraints['word_count']}."""
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _build_section_messages(self, section, content, grade):
+        requirement, shape = ANALYSIS_SECTIONS[section]
+        system_prompt = f"""You are a senior English teacher familiar with FLTRP (外研社) textbooks for {grade}.
+        You analyze a given English text for students at that level.
+        
+        Requirement: {requirement}
+        
+        Output Format:
+        Return ONLY a raw JSON object (no markdown formatting) of the form {{ "{section}": {shape} }}
+        """
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Text:\n{content}"}
+        ]
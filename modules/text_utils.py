@@ -0,0 +1,59 @@
+import re
+
+# Terminal punctuation (plus any closing quotes/brackets) followed by the start
+# of a new sentence, or a paragraph break.
+_SENTENCE_END = re.compile(r'[.!?]["\')\]]*(?=\s+["\'(\[]?[A-Z0-9])|\n\s*\n')
+
+
+def split_sentences(text):
+    """
+    Splits text into sentences without requiring NLTK data.
+    Returns a list of non-empty, stripped sentences.
+    """
+    if not text:
+        return []
+    sentences = []
+    start = 0
+    for m in _SENTENCE_END.finditer(text):
+        sentences.append(text[start:m.end()])
+        start = m.end()
+    sentences.append(text[start:])
+    return [s.strip() for s in sentences if s.strip()]
+
+
+def group_sentences(sentences, max_chars=600):
+    """
+    Greedily packs consecutive sentences into groups of at most max_chars
+    characters (a single longer sentence becomes its own group).
+    Returns a list of strings, in order.
+    """
+    groups = []
+    current = []
+    current_len = 0
+    for sent in sentences:
+        if current and current_len + len(sent) + 1 > max_chars:
+            groups.append(" ".join(current))
+            current = []
+            current_len = 0
+        current.append(sent)
+        current_len += len(sent) + 1
+    if current:
+        groups.append(" ".join(current))
+    return groups
+
+
+def get_shadowing_sentences(data, limit=5):
+    """
+    Returns the sentences offered for sentence shadowing: the model-picked
+    analysis.shadowing_sentences when present, otherwise the first few
+    sentences of the content.
+    """
+    analysis = data.get('analysis')
+    if analysis and isinstance(analysis, dict) and analysis.get('shadowing_sentences'):
+        return analysis['shadowing_sentences']
+    # Fallback: Split content into sentences and take the first few
+    try:
+        import nltk
+        return nltk.sent_tokenize(data['content'])[:limit]
+    except Exception:
+        return data['content'].split('.')[:limit]
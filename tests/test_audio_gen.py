@@ -0,0 +1,38 @@
+import asyncio
+
+import edge_tts
+
+from modules import audio_gen
+from modules.audio_gen import AudioGenerator
+from modules.ratelimit import get_provider
+
+
+class FlakyCommunicate:
+    """
+    Streams "<text>;" as audio, except that the first attempt for `fail_text`
+    drops out the way a closed Edge websocket does.
+    """
+    attempts = []
+    fail_text = None
+
+    def __init__(self, text, voice, rate=None, boundary=None):
+        self.text = text
+
+    async def stream(self):
+        FlakyCommunicate.attempts.append(self.text)
+        if self.text == self.fail_text and FlakyCommunicate.attempts.count(self.text) == 1:
+            raise edge_tts.exceptions.NoAudioReceived("No audio was received.")
+        yield {"type": "audio", "data": f"{self.text};".encode()}
+
+
+def test_failed_chunk_is_retried_on_its_own(monkeypatch, tmp_path):
+    monkeypatch.setattr(audio_gen.edge_tts, "Communicate", FlakyCommunicate)
+    monkeypatch.setattr(get_provider("edge"), "base_delay", 0.0)
+    FlakyCommunicate.attempts = []
+    FlakyCommunicate.fail_text = "two"
+
+    gen = AudioGenerator(output_dir=str(tmp_path), cache=False)
+    data = asyncio.run(gen._edge_tts_chunked_bytes(["one", "two", "three"]))
+
+    assert data == b"one;two;three;"
+    assert sorted(FlakyCommunicate.attempts) == ["one", "three", "two", "two"]
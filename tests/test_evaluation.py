@@ -0,0 +1,107 @@
+import json
+import sys
+import types
+
+import numpy as np
+
+from modules import audio_io, evaluation, offline_asr
+from modules.evaluation import Evaluator
+
+# SpeechAssessment response body as returned by the REST gateway (trimmed)
+ALIYUN_PAYLOAD = json.loads("""
+{
+  "task_id": "b6f1c3a2e4d94f0c9c2e7a1d5f3b8e60",
+  "result": {
+    "pronunciation_score": 78,
+    "fluency_score": 55,
+    "integrity_score": 100,
+    "words": [
+      {"text": "the", "score": 92, "start_time": 120, "end_time": 260},
+      {"text": "sky", "score": 41, "start_time": 260, "end_time": 610},
+      {"text": "is", "score": 88, "start_time": 610, "end_time": 740},
+      {"text": "blue", "score": 59, "start_time": 740, "end_time": 1100}
+    ]
+  },
+  "status": 20000000,
+  "message": "SUCCESS"
+}
+""")
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    def post(self, url, headers=None, data=None, timeout=None):
+        return FakeResponse(ALIYUN_PAYLOAD)
+
+
+def make_evaluator():
+    return Evaluator(app_key="app", ak_id="id", ak_secret="secret")
+
+
+def test_parse_aliyun_result():
+    result = make_evaluator()._parse_aliyun_result(ALIYUN_PAYLOAD)
+    assert result["total_score"] == 78
+    assert result["fluency_score"] == 55
+    assert result["integrity_score"] == 100
+    assert result["error_words"] == ["sky", "blue"]
+    assert "smoothly" in result["feedback"]
+    # Aliyun reports no character offsets, so highlighting falls back to the words
+    assert "error_spans" not in result
+    assert not result.get("simulated")
+
+
+def test_evaluate_aliyun_returns_parsed_scores(monkeypatch):
+    evaluator = make_evaluator()
+    evaluator.token = "token"
+    monkeypatch.setattr(evaluator, "get_token", lambda force_refresh=False: evaluator.token)
+    monkeypatch.setattr(evaluation, "get_http_session", lambda: FakeSession())
+
+    result = evaluator._evaluate_aliyun(b"RIFF", "the sky is blue")
+    assert not result.get("simulated")
+    assert result["total_score"] == 78
+    assert result["error_words"] == ["sky", "blue"]
+
+
+class FakeKaldiRecognizer:
+    decoded = []
+
+    def __init__(self, model, sample_rate):
+        self.samples = 0
+
+    def SetWords(self, enabled):
+        pass
+
+    def AcceptWaveform(self, data):
+        self.samples += len(data) // 2
+        return False
+
+    def FinalResult(self):
+        FakeKaldiRecognizer.decoded.append(self.samples)
+        return json.dumps({"text": "we read books", "result": []})
+
+
+def test_long_offline_recording_is_scored_in_segments(monkeypatch):
+    monkeypatch.setitem(sys.modules, "vosk", types.SimpleNamespace(KaldiRecognizer=FakeKaldiRecognizer))
+    monkeypatch.setattr(offline_asr, "is_available", lambda path=None: True)
+    monkeypatch.setattr(offline_asr, "get_model", lambda path=None: object())
+    FakeKaldiRecognizer.decoded = []
+
+    rate = audio_io.TARGET_SAMPLE_RATE
+    samples = (0.1 * np.sin(np.arange(60 * rate) * 0.05)).astype(np.float32)
+    text = " ".join(["We read books."] * 40)
+    result = make_evaluator().evaluate_audio(samples, text, method="offline", sample_rate=rate)
+
+    assert len(result["segments"]) > 1
+    assert not any(seg["error"] for seg in result["segments"])
+    assert not result.get("partial")
+    assert result["total_score"] > 0
+    assert sum(FakeKaldiRecognizer.decoded) == len(samples)
@@ -0,0 +1,31 @@
+from modules.library_search import SearchIndex
+from modules.library_store import LibraryStore
+
+
+def test_index_picks_up_changes_from_other_stores(tmp_path):
+    db_path = str(tmp_path / "library.db")
+    mine = LibraryStore(db_path=db_path, legacy_json=None)
+    other = LibraryStore(db_path=db_path, legacy_json=None)   # e.g. another process
+    index = SearchIndex().attach(mine)
+
+    first = mine.save({"title": "Stars", "content": "bright stars at night", "tags": ["space"]})
+    second = other.save({"title": "Moon", "content": "the moon and the stars", "tags": ["moon"]})
+    assert {d for d, _ in index.search("stars")} == {first, second}
+    assert index.tags() == ["moon", "space"]
+
+    other.save({"title": "Moon", "content": "the moon alone", "tags": ["moon"]})
+    other.delete("Stars")
+    assert index.search("stars") == []
+    assert index.tags() == ["moon"]
+    assert len(index) == 1
+
+
+def test_background_build_catches_up_on_saves_made_meanwhile(tmp_path):
+    store = LibraryStore(db_path=str(tmp_path / "library.db"), legacy_json=None)
+    store.save_many([{"title": f"Article {i}", "content": f"stars number {i}"} for i in range(200)])
+
+    index = SearchIndex().attach(store, background=True)
+    comet = store.save({"title": "Comet", "content": "a comet passes"})
+    assert index.ready.wait(10)
+    assert [d for d, _ in index.search("comet")] == [comet]
+    assert len(index.search("stars", limit=None)) == 200
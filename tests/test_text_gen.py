@@ -0,0 +1,95 @@
+import json
+import re
+import threading
+import time
+import types
+
+from modules.text_gen import ANALYSIS_SECTIONS, TextGenerator
+
+ARTICLE = {"title": "The Sky", "content": "The sky is blue. Clouds drift by.", "keywords": ["sky"]}
+
+
+def completion(payload):
+    message = types.SimpleNamespace(content=json.dumps(payload))
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+class FakeCompletions:
+    """
+    Answers article and section requests; `bad` maps a section to how many of
+    its next answers are malformed (not a list).
+    """
+    def __init__(self, bad=None):
+        self.bad = dict(bad or {})
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def create(self, messages, stream=False, **kwargs):
+        if stream:
+            self.calls.append("stream")
+            return self._stream(json.dumps(dict(ARTICLE, analysis={})))
+        match = re.search(r'of the form \{ "(\w+)":', messages[0]["content"])
+        section = match.group(1) if match else None
+        with self._lock:
+            self.calls.append(section or "article")
+            malformed = self.bad.get(section, 0) > 0
+            if malformed:
+                self.bad[section] -= 1
+        if section is None:
+            return completion(ARTICLE)
+        return completion({section: "oops" if malformed else [f"{section} item"]})
+
+    @staticmethod
+    def _stream(body):
+        for start in range(0, len(body), 16):
+            delta = types.SimpleNamespace(content=body[start:start + 16])
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)])
+
+
+def make_generator(completions):
+    gen = TextGenerator(api_key="test-key")
+    gen.client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    return gen
+
+
+def test_malformed_section_is_retried_alone():
+    completions = FakeCompletions(bad={"shadowing_sentences": 1})
+    data = make_generator(completions).generate_text("Grade 3", "sky", pipeline=True)
+    assert all(data["analysis"][name] for name in ANALYSIS_SECTIONS)
+    assert completions.calls.count("shadowing_sentences") == 2
+    assert completions.calls.count("vocabulary") == 1
+
+
+def test_cached_article_refills_failed_sections():
+    completions = FakeCompletions(bad={"shadowing_sentences": 2})
+    gen = make_generator(completions)
+    first = gen.generate_text("Grade 3", "sky", pipeline=True)
+    assert first["analysis"]["shadowing_sentences"] == []
+
+    calls = len(completions.calls)
+    second = gen.generate_text("Grade 3", "sky", pipeline=True)
+    assert second["analysis"]["shadowing_sentences"] == ["shadowing_sentences item"]
+    # Only the missing section was requested; the article came from the cache
+    assert completions.calls[calls:] == ["shadowing_sentences"]
+
+    third = gen.generate_text("Grade 3", "sky", pipeline=True)
+    assert third == second
+    assert len(completions.calls) == calls + 1
+
+
+def test_waiting_caller_takes_over_an_abandoned_stream():
+    completions = FakeCompletions()
+    gen = make_generator(completions)
+    stream = gen.generate_text_stream("Grade 3", "sky")
+    next(stream)   # the stream is now the in-flight leader
+
+    outcome = {}
+    waiter = threading.Thread(target=lambda: outcome.update(data=gen.generate_text("Grade 3", "sky")))
+    waiter.start()
+    while not gen._inflight.shared:
+        time.sleep(0.01)
+    stream.close()   # the streaming page went away
+    waiter.join(5)
+
+    assert outcome["data"]["title"] == ARTICLE["title"]
+    assert completions.calls == ["stream", "article"]